@@ -12,10 +12,14 @@ setup(
 	install_requires=[
 		'numpy',
 		'pandas',
-		'dash',
+		'dash>=2.16',
 		'dash-bootstrap-components',
 		'pyserial'
 	],
+	extras_require={
+		'fast': ['orjson'],
+		'test': ['pytest']
+	},
 	entry_points={
 		'console_scripts': [
 			'thrustrig = thrustrig.main:main'
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from thrustrig import archive
+from thrustrig.archive import Archive, ArchiveWriter
+
+columns = ['Timestamp', 'Thrust (N)', 'Raw', 'Quality']
+
+def make_rows(n, t0=1.7e9):
+	rng = np.random.default_rng(1)
+	rows = np.empty((n, len(columns)))
+	rows[:, 0] = t0 + np.round(np.arange(n) * 0.5 + rng.uniform(0, 0.01, n), 6)
+	rows[:, 1] = np.round(rng.normal(5, 2, n), 3)
+	rows[:, 2] = rng.normal(0, 1, n)
+	rows[:, 3] = rng.integers(0, 2**16, n)
+	rows[::7, 1] = np.nan
+	return rows
+
+def write(path, chunks):
+	writer = ArchiveWriter(str(path), columns)
+	for rows in chunks:
+		writer.append(rows)
+	writer.close()
+
+@pytest.mark.parametrize('col', [
+	np.round(np.linspace(-3, 3, 101), 2),
+	np.array([1.7e9 + 0.123456, 1.7e9 + 0.5, np.nan]),
+	np.random.default_rng(2).normal(size=50),
+	np.array([np.nan, np.nan]),
+])
+def test_encode_lossless(col):
+	np.testing.assert_array_equal(archive.decode(archive.encode(col), len(col)), col)
+
+def test_round_trip(tmp_path):
+	rows = make_rows(1000)
+	path = tmp_path / 'run.tra'
+	write(path, [rows[:300], rows[300:301], rows[301:]])
+	a = Archive(str(path))
+	assert a.columns == columns
+	assert len(a) == len(rows)
+	assert a.sizes == [300, 1, 699]
+	np.testing.assert_array_equal(a.read(), rows)
+
+def test_read_range(tmp_path):
+	rows = make_rows(500)
+	path = tmp_path / 'run.tra'
+	write(path, [rows[i:i + 64] for i in range(0, len(rows), 64)])
+	a = Archive(str(path))
+	for start, stop in [(0, 1), (63, 65), (64, 128), (100, 433), (499, 500), (490, 1000), (200, 200)]:
+		np.testing.assert_array_equal(a.read(start, stop), rows[start:stop])
+	np.testing.assert_array_equal(a.read(10, 20, cols=[1, 3]), rows[10:20][:, [1, 3]])
+
+def test_read_time(tmp_path):
+	rows = make_rows(500)
+	path = tmp_path / 'run.tra'
+	write(path, [rows[i:i + 50] for i in range(0, len(rows), 50)])
+	a = Archive(str(path))
+	t = rows[:, 0]
+	for t0, t1 in [(t[0], t[-1] + 1), (t[49], t[50]), (t[10] + 0.1, t[333]), (t[-1] + 1, None), (None, t[0])]:
+		lo = -np.inf if t0 is None else t0
+		hi = np.inf if t1 is None else t1
+		np.testing.assert_array_equal(a.read_time(t0, t1), rows[(t >= lo) & (t < hi)])
+	# The timestamp is always the first column
+	np.testing.assert_array_equal(a.read_time(t[100], t[200], cols=[3]), rows[100:200][:, [0, 3]])
+
+def test_refresh_skips_incomplete_chunk(tmp_path):
+	rows = make_rows(200)
+	path = tmp_path / 'run.tra'
+	write(path, [rows[:100]])
+	a = Archive(str(path))
+	full = tmp_path / 'full.tra'
+	write(full, [rows[:100], rows[100:]])
+	data = full.read_bytes()
+	# Half of the second chunk written
+	with open(path, 'ab') as f:
+		f.write(data[a.end:(a.end + len(data)) // 2])
+	a.refresh()
+	assert len(a) == 100
+	with open(path, 'ab') as f:
+		f.write(data[(a.end + len(data)) // 2:])
+	a.refresh()
+	assert len(a) == 200
+	np.testing.assert_array_equal(a.read(), rows)
+
+def test_not_an_archive(tmp_path):
+	path = tmp_path / 'run.tra'
+	path.write_bytes(b'Timestamp,Thrust\n')
+	with pytest.raises(ValueError):
+		Archive(str(path))
@@ -0,0 +1,195 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from thrustrig.acquisition import Acquisition, columns
+from thrustrig.interlock import Interlock
+from thrustrig.ringbuffer import RingBuffer, TRIPPED
+
+thrust = columns.index('Thrust (N)')
+current = columns.index('Current (A)')
+temp = columns.index('Coil Temperature (C)')
+
+class Trips:
+	def __init__(self):
+		self.calls = []
+
+	def __call__(self, reason, t):
+		self.calls.append((reason, t))
+
+def interlock(rules, active=(temp, current, thrust)):
+	trips = Trips()
+	return Interlock(rules, columns, list(active), trips), trips
+
+def test_max_min():
+	lock, trips = interlock([{'column': 'Coil Temperature (C)', 'max': 120}, {'column': 'Thrust (N)', 'min': -1}])
+	lock.feed([temp], [119.9], 1.0)
+	lock.feed([thrust], [-0.5], 1.0)
+	assert trips.calls == []
+	lock.feed([temp], [120.5], 2.0)
+	assert len(trips.calls) == 1
+	assert 'above 120' in trips.calls[0][0] and trips.calls[0][1] == 2.0
+	lock.clear()
+	lock.feed([thrust], [-2.0], 3.0)
+	assert 'below -1' in trips.calls[1][0]
+
+def test_rate():
+	lock, trips = interlock([{'column': 'Current (A)', 'rate': 10}])
+	lock.feed([current], [1.0], 0.0)
+	lock.feed([current], [5.0], 0.5)
+	assert trips.calls == []
+	lock.feed([current], [11.0], 1.0)
+	assert 'changing 12.0/s' in trips.calls[0][0]
+
+def test_missing_readings_and_inactive_columns():
+	lock, trips = interlock([{'column': 'Current (A)', 'max': 1}, {'column': 'Thrust (N)', 'max': 1}], active=[current])
+	lock.feed([current], [None], 0.0)
+	lock.feed([current], [float('nan')], 0.0)
+	# The thrust sensor is disabled, its rule is dropped
+	lock.feed([thrust], [5.0], 0.0)
+	assert trips.calls == []
+
+def test_stale():
+	lock, trips = interlock([{'column': 'Thrust (N)', 'stale': 0.5}])
+	now = time.time()
+	lock.check_stale(now + 0.4)
+	assert trips.calls == []
+	lock.feed([thrust], [1.0], now + 0.4)
+	lock.check_stale(now + 0.8)
+	assert trips.calls == []
+	lock.check_stale(now + 1.0)
+	assert len(trips.calls) == 1
+	# Cleared, the wait starts again from now
+	lock.clear()
+	now = time.time()
+	lock.check_stale(now + 0.4)
+	assert len(trips.calls) == 1
+	lock.check_stale(now + 0.6)
+	assert len(trips.calls) == 2
+
+def test_watchdog():
+	lock, trips = interlock([{'column': 'Thrust (N)', 'stale': 0.2}])
+	stop = threading.Event()
+	watchdog = threading.Thread(target=lock.run, args=(stop.is_set,))
+	watchdog.start()
+	try:
+		end = time.time() + 0.5
+		while time.time() < end:
+			lock.feed([thrust], [1.0], time.time())
+			time.sleep(0.02)
+		assert trips.calls == []
+		time.sleep(0.4)
+		assert len(trips.calls) == 1
+		lock.clear()
+		time.sleep(0.1)
+		assert len(trips.calls) == 1
+		time.sleep(0.3)
+		assert len(trips.calls) == 2
+	finally:
+		stop.set()
+		watchdog.join()
+
+def test_single_trip():
+	lock, trips = interlock([{'column': 'Current (A)', 'max': 10}, {'column': 'Thrust (N)', 'max': 10}])
+	start = threading.Barrier(8)
+	def reader(col):
+		start.wait()
+		for i in range(200):
+			lock.feed([col], [20.0], time.time())
+	threads = [threading.Thread(target=reader, args=(current if i % 2 else thrust,)) for i in range(8)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	assert len(trips.calls) == 1
+	assert lock.tripped == trips.calls[0][0]
+
+class FakeDriver:
+	# Records the PWMDriver calls of the command thread
+	def __init__(self):
+		self.calls = []
+		self.val = 1000
+		self.ramp_active = False
+
+	def set(self, val):
+		self.calls.append(('set', val))
+		self.val = val
+		return True
+
+	def ramp(self, peak, step, period):
+		self.calls.append(('ramp', peak, step, period))
+		return True
+
+	def stop_ramp(self):
+		self.calls.append(('stop_ramp',))
+		return True
+
+	def upload_wave(self, times, vals):
+		self.calls.append(('upload_wave', len(times)))
+		return True
+
+	def wait_loaded(self):
+		return True
+
+	def start_wave(self):
+		self.calls.append(('start_wave',))
+		return True
+
+	def close(self):
+		pass
+
+@pytest.fixture
+def acquisition():
+	buffer = RingBuffer(capacity=12, ncols=len(columns))
+	commands = queue.Queue()
+	events = queue.Queue()
+	driver = FakeDriver()
+	acq = Acquisition([], driver, buffer, None, None, None, commands, events, {'enable': True, 'rules': []})
+	thread = threading.Thread(target=acq.command_loop)
+	thread.start()
+	yield acq, driver, commands, events
+	commands.put(('stop',))
+	thread.join(2)
+	buffer.close()
+
+def run_commands(commands, *cmds):
+	for cmd in cmds:
+		commands.put(cmd)
+	while not commands.empty():
+		time.sleep(0.01)
+	time.sleep(0.1)
+
+def test_commands(acquisition):
+	acq, driver, commands, events = acquisition
+	run_commands(commands, ('set', 1200), ('ramp', 1500, 10, 1), ('play_wave', [0, 1], [1000, 1100]), ('stop_ramp',))
+	assert driver.calls == [
+		('set', 1200), ('ramp', 1500, 10, 1), ('upload_wave', 2), ('start_wave',), ('stop_ramp',)
+	]
+
+def test_commands_while_tripped(acquisition):
+	acq, driver, commands, events = acquisition
+	acq.interlock.trip('Current (A) 70.00 above 60', time.time())
+	# The trip cut the motor and was reported
+	assert driver.calls == [('stop_ramp',), ('set', 1000)]
+	assert acq.buffer.meta[TRIPPED] == 1
+	assert events.get_nowait()[:2] == ('trip', 'Current (A) 70.00 above 60')
+	driver.calls.clear()
+	run_commands(commands, ('set', 1500), ('ramp', 1500, 10, 1), ('play_wave', [0, 1], [1000, 1100]), ('stop_ramp',))
+	assert driver.calls == [('stop_ramp',)]
+	run_commands(commands, ('clear_trip',), ('set', 1100))
+	assert acq.buffer.meta[TRIPPED] == 0
+	assert driver.calls == [('stop_ramp',), ('set', 1100)]
+
+def test_failing_command(acquisition):
+	acq, driver, commands, events = acquisition
+	# The driver raises on an empty input, the thread goes on
+	run_commands(commands, ('set', None, 'extra'), ('set', 1100))
+	assert driver.calls == [('set', 1100)]
+
+def test_stop_cuts_motor(acquisition):
+	acq, driver, commands, events = acquisition
+	run_commands(commands, ('set', 1400), ('stop',))
+	assert acq.stop
+	assert driver.calls[-2:] == [('stop_ramp',), ('set', 1000)]
@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+
+from thrustrig import journal
+from thrustrig.archive import Archive, ArchiveWriter
+from thrustrig.journal import Journal
+
+columns = ['Timestamp', 'Thrust (N)', 'RPM']
+
+def make_rows(n):
+	rows = np.empty((n, len(columns)))
+	rows[:, 0] = 1.7e9 + np.arange(n) * 0.5
+	rows[:, 1] = np.round(np.sin(np.arange(n)), 3)
+	rows[:, 2] = np.arange(n) * 10
+	return rows
+
+def test_recover_torn_chunk(tmp_path):
+	rows = make_rows(60)
+	path = str(tmp_path / 'run.tra')
+	writer = ArchiveWriter(path, columns)
+	wal = Journal(path, len(columns))
+	for i, row in enumerate(rows[:40]):
+		wal.append(i, row)
+	# First chunk written, the journal keeps the rest
+	writer.append(rows[:20], sync=True)
+	wal.checkpoint(20, rows[20:40])
+	for i, row in enumerate(rows[40:], 40):
+		wal.append(i, row)
+	wal.sync()
+	# The crash cuts the second chunk short
+	end = os.path.getsize(path)
+	writer.append(rows[20:50])
+	writer.close()
+	with open(path, 'r+b') as f:
+		f.truncate(end + (os.path.getsize(path) - end) // 2)
+	archive = journal.recover(path, columns)
+	assert not os.path.exists(journal.journal_path(path))
+	np.testing.assert_array_equal(archive.read(), rows)
+	np.testing.assert_array_equal(Archive(path).read(), rows)
+
+def test_recover_skips_archived_and_duplicate_records(tmp_path):
+	rows = make_rows(30)
+	path = str(tmp_path / 'run.tra')
+	writer = ArchiveWriter(path, columns)
+	writer.append(rows[:10])
+	writer.close()
+	records = np.column_stack([np.r_[np.arange(5, 30), np.arange(25, 30)], np.r_[rows[5:], rows[25:]]])
+	records.astype('<f8').tofile(journal.journal_path(path))
+	archive = journal.recover(path, columns)
+	np.testing.assert_array_equal(archive.read(), rows)
+
+def test_recover_partial_record(tmp_path):
+	rows = make_rows(10)
+	path = str(tmp_path / 'run.tra')
+	records = np.column_stack([np.arange(10), rows]).astype('<f8').tobytes()
+	with open(journal.journal_path(path), 'wb') as f:
+		f.write(records[:-5])
+	# Died before the archive header was written
+	open(path, 'wb').close()
+	archive = journal.recover(path, columns)
+	assert archive.columns == columns
+	np.testing.assert_array_equal(archive.read(), rows[:9])
+
+def test_clean_close_removes_journal(tmp_path):
+	path = str(tmp_path / 'run.tra')
+	wal = Journal(path, len(columns))
+	assert os.path.isfile(journal.journal_path(path))
+	wal.close()
+	assert not os.path.exists(journal.journal_path(path))
+
+def test_checkpoints(tmp_path):
+	rows = make_rows(30)
+	path = str(tmp_path / 'run.tra')
+	wal = Journal(path, len(columns))
+	for i, row in enumerate(rows):
+		wal.append(i, row)
+	# Every spill replaces the journal of the same Journal
+	wal.checkpoint(10, rows[10:])
+	wal.checkpoint(20, rows[20:])
+	wal.append(30, make_rows(31)[30])
+	wal.sync()
+	records = np.fromfile(journal.journal_path(path), dtype='<f8').reshape(-1, len(columns) + 1)
+	np.testing.assert_array_equal(records[:, 0], np.arange(20, 31))
+	np.testing.assert_array_equal(records[:-1, 1:], rows[20:])
+	wal.close()
+	assert not os.path.exists(journal.journal_path(path))
@@ -0,0 +1,88 @@
+import math
+
+import numpy as np
+import pytest
+
+from thrustrig import quality, stats
+from thrustrig.stats import P2, RunWindow, Stats, Window
+
+def test_window_matches_numpy():
+	rng = np.random.default_rng(3)
+	values = np.round(rng.normal(10, 3, 400), 2)
+	window = Window(10)
+	for i, x in enumerate(values):
+		t = i * 0.5
+		window.add(t, x)
+		window.expire(t)
+		if i % 37 == 0:
+			# Readings of the last 10 s
+			last = values[max(0, i - 19):i + 1]
+			expected = [last.mean(), last.min(), last.max(), last.std(ddof=1) if len(last) > 1 else 0.0]
+			expected += [np.percentile(last, p) for p in stats.percentiles]
+			np.testing.assert_allclose(window.result(), expected, rtol=1e-9, atol=1e-9)
+
+def test_empty_window():
+	assert all(math.isnan(v) for v in Window(10).result())
+	assert all(math.isnan(v) for v in RunWindow().result())
+
+def test_p2_exact_for_first_readings():
+	values = np.random.default_rng(4).uniform(0, 100, stats.exact - 1)
+	q = P2(0.95)
+	for x in values:
+		q.add(x)
+	assert q.value() == pytest.approx(np.percentile(values, 95))
+
+@pytest.mark.parametrize('p', [0.05, 0.5, 0.95])
+def test_p2_estimate(p):
+	values = np.random.default_rng(5).normal(100, 15, 20000)
+	q = P2(p)
+	for x in values:
+		q.add(x)
+	assert q.value() == pytest.approx(np.percentile(values, p * 100), rel=0.01)
+
+def test_run_window():
+	values = np.random.default_rng(6).normal(0, 1, 5000)
+	window = RunWindow()
+	for i, x in enumerate(values):
+		window.add(i, x)
+	mean, lo, hi, std = window.result()[:4]
+	assert mean == pytest.approx(values.mean())
+	assert (lo, hi) == (values.min(), values.max())
+	assert std == pytest.approx(values.std(ddof=1))
+
+def test_stats_update():
+	# Timestamp, two readings and the Quality column
+	s = Stats(3, 3, 2)
+	rows = np.array([
+		[0.0, 1.0, np.nan, 0],
+		[0.5, 2.0, 4.0, 0],
+		[1.0, 3.0, 6.0, 0],
+	])
+	s.update(rows)
+	results = s.read()
+	assert results[0][0][:3] == [2.0, 1.0, 3.0]
+	# The missing reading is left out
+	assert results[0][1][:3] == [5.0, 4.0, 6.0]
+	assert s.state()[1] == 3
+
+def test_quality_counts():
+	s = Stats(3, 3, 2)
+	rows = np.array([
+		[0.0, 1.0, np.nan, 0],
+		[0.5, 2.0, 4.0, quality.DECODE],
+		[1.0, 3.0, 6.0, quality.DECODE | quality.STALE << quality.bits],
+	])
+	s.update(rows)
+	count, flagged = s.read_quality()
+	assert count == 3
+	# Rows per sensor and flag, in the order of quality.flag_names
+	np.testing.assert_array_equal(flagged, [[0, 2, 0, 0], [0, 0, 0, 1]])
+	s.clear()
+	assert s.read_quality()[0] == 0
+	assert not s.read_quality()[1].any()
+
+def test_sensor_flags():
+	q = np.array([0, quality.TIMEOUT | quality.CLAMP << quality.bits, quality.STALE << 3 * quality.bits])
+	np.testing.assert_array_equal(quality.sensor_flags(q, 0), [0, quality.TIMEOUT, 0])
+	np.testing.assert_array_equal(quality.sensor_flags(q, 1), [0, quality.CLAMP, 0])
+	np.testing.assert_array_equal(quality.sensor_flags(q, 3), [0, 0, quality.STALE])
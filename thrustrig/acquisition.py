@@ -0,0 +1,413 @@
+import multiprocessing
+import threading
+import datetime
+import queue
+import time
+import sys
+
+import numpy as np
+import serial
+
+from .sensors import TemperatureSensor, VoltAmpSensor, ThrustSensor, RPMSensor
+from .pwm_driver import PWMDriver
+from .ringbuffer import RingBuffer, ARCHIVED, PWM_ENABLED, PWM_VAL, RAMP_ACTIVE, TRIPPED
+from .interlock import Interlock
+from .archive import ArchiveWriter
+from .journal import Journal
+from . import quality
+
+# Quality holds the flags of every sensor for the row, see quality.py
+columns = ['Timestamp', 'Coil Temperature (C)', 'Voltage (V)', 'Current (A)', 'Batt Temperature (C)', 'Thrust (N)', 'RPM', 'PWM', 'Quality']
+
+# Seconds between two rows
+sample_period = 0.5
+# Seconds a reading is used for the rows after it arrived
+max_age = 2.0
+# Serial read timeouts follow the rate of each device, within these bounds
+min_timeout = 0.05
+max_timeout = 2.0
+# A device without a valid reading for stale_periods of its usual interval, and at least min_stale seconds, is reopened
+stale_periods = 10
+min_stale = 3.0
+# Seconds between two attempts to reopen a device, doubled after every failure
+backoff_start = 0.5
+backoff_max = 10.0
+# Config sections of the sensors, in the order of open_devices()
+sensor_names = ['temp', 'batt', 'thrust', 'rpm']
+pwm_col = columns.index('PWM')
+quality_col = columns.index('Quality')
+
+def open_devices(config):
+	sensors = [
+		TemperatureSensor(config['temp']['port'], config['temp']['baudrate']),
+		VoltAmpSensor(config['batt']['port'], config['batt']['baudrate']),
+		ThrustSensor(
+			config['thrust']['port'],
+			config['thrust']['baudrate'],
+			config['thrust']['offset'],
+			config['thrust']['scale'],
+			config['thrust']['senlen'],
+			config['thrust']['efflen']
+		),
+		RPMSensor(config['rpm']['sigrokpath'])
+	]
+	pwmdriver = None
+	try:
+		if config['temp']['enable']:
+			sensors[0].start()
+		if config['batt']['enable']:
+			sensors[1].start()
+		if config['thrust']['enable']:
+			sensors[2].start()
+		if config['rpm']['enable']:
+			sensors[3].start()
+		if config['pwm']['enable']:
+			pwmdriver = PWMDriver(config['pwm']['port'], config['pwm']['baudrate'])
+			pwmdriver.start()
+	except:
+		for sensor in sensors: sensor.close()
+		raise
+	return sensors, pwmdriver
+
+def release_motor(config):
+	# Last resort after the acquisition process was killed without its cleanup: its port is free again
+	if not config['pwm']['enable']:
+		return
+	try:
+		with serial.Serial(config['pwm']['port'], config['pwm']['baudrate'], timeout=1, write_timeout=1) as ser:
+			ser.write(b"stop \nwabort\nset 1000\n")
+			ser.flush()
+	except serial.SerialException as e:
+		print(f'motor cutoff failed: {e}')
+
+class SensorReader:
+	# Reads one sensor continuously in its own thread and hands every reading to the interlock as it arrives.
+	# Also supervises the device: adapts the read timeout to its rate and reopens it when it goes quiet or away
+
+	def __init__(self, name, sensor, cols, interlock, on_state, raw=None):
+		self.name = name
+		self.sensor = sensor
+		self.cols = cols
+		self.interlock = interlock
+		# Called with the name, 'lost' or 'ok' and the time of the last good reading or of the recovery
+		self.on_state = on_state
+		# Ring every reading goes to, for the vibration spectrum
+		self.raw = raw
+		self.vals = [None] * len(cols)
+		self.t = None
+		# Quality flags of the reads since the last row
+		self.flags = 0
+		self.flags_lock = threading.Lock()
+		# Mean seconds between two valid readings
+		self.interval = None
+		self.lost = False
+		self.stop = False
+		self.thread = threading.Thread(target=self.loop, daemon=True)
+
+	def stale_after(self):
+		if self.interval is None:
+			return min_stale
+		return max(min_stale, stale_periods * self.interval)
+
+	def read_timeout(self):
+		# Four intervals: a device quieter than that is late
+		if self.interval is None:
+			return max_timeout
+		return min(max(4 * self.interval, min_timeout), max_timeout)
+
+	def adapt_timeout(self):
+		# Only sensors reading lines with a serial timeout
+		if getattr(self.sensor, 'timeout', None) is None or getattr(self.sensor, 'ser', None) is None:
+			return
+		timeout = self.read_timeout()
+		# Setting it reconfigures the port, skip small changes
+		if abs(timeout - self.sensor.timeout) > 0.2 * self.sensor.timeout:
+			self.sensor.timeout = timeout
+			self.sensor.ser.timeout = timeout
+
+	def wait(self, delay):
+		end = time.time() + delay
+		while not self.stop and time.time() < end:
+			time.sleep(0.05)
+
+	def reconnect(self, last):
+		# Reopens the device until it works, waiting longer after every failure
+		if not self.lost:
+			self.lost = True
+			self.on_state(self.name, 'lost', last)
+		delay = backoff_start
+		while not self.stop:
+			self.sensor.close()
+			try:
+				self.sensor.start()
+			except Exception:
+				self.wait(delay)
+				delay = min(2 * delay, backoff_max)
+				continue
+			if self.stop:
+				self.sensor.close()
+			return
+
+	def loop(self):
+		# Start of the current wait for a valid reading
+		since = time.time()
+		while not self.stop:
+			try:
+				reading = self.sensor.read()
+				flags = self.sensor.flags
+				if flags & quality.TIMEOUT and time.time() - max(self.t or since, since) <= self.read_timeout():
+					# A read window shorter than the device's interval, the normal wait between two readings
+					flags &= ~quality.TIMEOUT
+				if flags:
+					with self.flags_lock:
+						self.flags |= flags
+			except Exception:
+				# The port is closed when stopping, else it went away
+				if self.stop:
+					break
+				self.reconnect(self.t or since)
+				since = time.time()
+				continue
+			t = time.time()
+			vals = list(reading) if isinstance(reading, (list, tuple)) else [reading]
+			if all(val is None for val in vals):
+				if t - max(self.t or since, since) > self.stale_after():
+					self.reconnect(self.t or since)
+					since = time.time()
+				else:
+					time.sleep(0.01)
+				continue
+			if self.t is not None and not self.lost:
+				dt = t - self.t
+				self.interval = dt if self.interval is None else 0.9 * self.interval + 0.1 * dt
+				self.adapt_timeout()
+			if self.lost:
+				self.lost = False
+				self.on_state(self.name, 'ok', t)
+			self.vals, self.t = vals, t
+			self.interlock.feed(self.cols, vals, t)
+			if self.raw is not None and vals[0] is not None:
+				self.raw.append((t, vals[0]))
+
+	def latest(self, now):
+		if self.t is None or now - self.t > max_age:
+			return [None] * len(self.cols)
+		return self.vals
+
+	def take_flags(self, last_row):
+		# Flags for a row, the reads since the last one and whether a new reading came since
+		with self.flags_lock:
+			flags, self.flags = self.flags, 0
+		if self.t is None or (last_row is not None and self.t <= last_row):
+			flags |= quality.STALE
+		return flags
+
+class Acquisition:
+	# Runs in the acquisition process of a rig, owns the devices and is the only writer of the ring buffer
+
+	def __init__(self, sensors, pwmdriver, buffer, raw, archive, journal, commands, events, limits):
+		self.sensors = sensors
+		self.pwmdriver = pwmdriver
+		self.buffer = buffer
+		self.archive = archive
+		self.journal = journal
+		# Index of the first row of the archive in the ring buffer
+		self.first = int(buffer.meta[ARCHIVED])
+		self.commands = commands
+		self.events = events
+		self.stop = False
+		self.reset = False
+		self.last_ts = None
+		# Time of the last row
+		self.last_row = None
+		self.ncols = buffer.ncols
+		# Rows are spilled in chunks of a sixth of the ring, long before they are overwritten
+		self.spill_rows = max(1, buffer.capacity // 6)
+		# Held while a PWM command is checked and sent, so none slips in after a trip
+		self.pwm_lock = threading.Lock()
+
+		self.readers = []
+		# Sensor index of each reader, for the bits in the Quality column
+		self.quality_shift = []
+		col = 1
+		for i, (name, sensor) in enumerate(zip(sensor_names, sensors)):
+			cols = list(range(col, col + sensor.n_vals))
+			if sensor.enabled():
+				raw_ring = raw if cols == [columns.index('Thrust (N)')] else None
+				self.readers.append(SensorReader(name, sensor, cols, None, self.device_state, raw_ring))
+				self.quality_shift.append(quality.bits * i)
+			col += sensor.n_vals
+		active_cols = [c for reader in self.readers for c in reader.cols]
+		self.interlock = Interlock(limits['rules'] if limits['enable'] else [], columns, active_cols, self.trip)
+		for reader in self.readers:
+			reader.interlock = self.interlock
+
+	def cutoff(self):
+		# Motor to 1000 under the lock the command thread holds, no command slips in after it
+		with self.pwm_lock:
+			if self.pwmdriver is not None:
+				self.pwmdriver.stop_ramp()
+				self.pwmdriver.set(1000)
+
+	def trip(self, reason, t):
+		# Called from the reader or watchdog thread that saw the failed rule
+		self.cutoff()
+		latency = time.time() - t
+		self.buffer.meta[TRIPPED] = 1
+		self.publish_pwm()
+		self.events.put(('trip', reason, t, latency))
+
+	def device_state(self, name, state, t):
+		# A device was lost or is back, the rows in between have no readings from it
+		self.events.put(('device', name, state, t))
+
+	def publish_pwm(self):
+		meta = self.buffer.meta
+		meta[PWM_ENABLED] = self.pwmdriver is not None
+		if self.pwmdriver is not None:
+			meta[PWM_VAL] = self.pwmdriver.val
+			meta[RAMP_ACTIVE] = self.pwmdriver.ramp_active
+
+	def command_loop(self):
+		# PWM commands are applied right away instead of waiting for the next sample
+		while not self.stop:
+			try:
+				cmd, *args = self.commands.get(timeout=0.05)
+			except queue.Empty:
+				self.publish_pwm()
+				continue
+			if cmd == 'stop':
+				# Motor off first, closing the devices can block
+				self.cutoff()
+				self.stop = True
+			elif cmd == 'reset':
+				self.reset = True
+			elif cmd == 'clear_trip':
+				self.interlock.clear()
+				self.buffer.meta[TRIPPED] = 0
+			elif self.pwmdriver is not None:
+				try:
+					if cmd == 'play_wave':
+						self.play_wave(*args)
+					else:
+						with self.pwm_lock:
+							# Only stop commands while the interlock is tripped
+							if self.interlock.tripped is None or cmd == 'stop_ramp':
+								getattr(self.pwmdriver, cmd)(*args)
+				except Exception as e:
+					# A bad command must not end the thread, Stop and the cutoff depend on it
+					print(f'PWM command {cmd} failed: {e!r}')
+			self.publish_pwm()
+
+	def play_wave(self, times, vals):
+		# PWMDriver.play_wave in steps, the controller's answer is awaited without the lock so a trip can cut in
+		with self.pwm_lock:
+			if self.interlock.tripped is not None or not self.pwmdriver.upload_wave(times, vals):
+				return
+		if not self.pwmdriver.wait_loaded():
+			return
+		with self.pwm_lock:
+			if self.interlock.tripped is None:
+				self.pwmdriver.start_wave()
+
+	def spill(self, flush=False):
+		# Writes a chunk once spill_rows rows are waiting, or all of them when flushing
+		archived = int(self.buffer.meta[ARCHIVED])
+		if self.buffer.count() - archived < (1 if flush else self.spill_rows):
+			return
+		first, rows = self.buffer.read(archived)
+		if not flush:
+			rows = rows[:self.spill_rows]
+		self.archive.append(rows, sync=True)
+		archived = first + len(rows)
+		self.buffer.meta[ARCHIVED] = archived
+		# Checkpoint, the journal only keeps the rows the archive doesn't have
+		self.journal.checkpoint(archived - self.first, self.buffer.read(archived)[1])
+
+	def collect_data(self):
+		parent = multiprocessing.parent_process()
+		while not self.stop:
+			if parent is not None and not parent.is_alive():
+				# The dashboard died, stop cleanly so the run can be restored
+				break
+			if self.reset:
+				self.buffer.clear()
+				self.archive.clear()
+				self.journal.checkpoint(0, np.empty((0, self.ncols)))
+				self.first = 0
+				self.reset = False
+			if self.last_ts is not None and (datetime.datetime.now() - self.last_ts).total_seconds() < sample_period:
+				time.sleep(0.1)
+				continue
+			timestamp = datetime.datetime.now()
+			now = timestamp.timestamp()
+			row = np.full(self.ncols, np.nan)
+			row[0] = now
+			flags = 0
+			for reader, shift in zip(self.readers, self.quality_shift):
+				row[reader.cols] = [np.nan if val is None else val for val in reader.latest(now)]
+				flags |= reader.take_flags(self.last_row) << shift
+			row[quality_col] = flags
+			if self.pwmdriver is not None:
+				row[pwm_col] = self.pwmdriver.val
+			self.last_row = now
+			self.buffer.append(row)
+			self.journal.append(self.buffer.count() - 1 - self.first, row)
+			self.spill()
+			self.last_ts = timestamp
+
+	def start(self):
+		for reader in self.readers:
+			reader.thread.start()
+		self.watchdog = threading.Thread(target=self.interlock.run, args=(lambda: self.stop,), daemon=True)
+		self.watchdog.start()
+
+	def close(self):
+		self.cutoff()
+		for reader in self.readers:
+			reader.stop = True
+		for sensor in self.sensors: sensor.close()
+		for reader in self.readers:
+			reader.thread.join(1)
+		if self.pwmdriver is not None:
+			self.publish_pwm()
+			time.sleep(0.1)
+			self.pwmdriver.close()
+			self.pwmdriver = None
+
+def run(config, shm_name, raw_name, archive_path, commands, status, events):
+	# Entry point of the acquisition process
+	# Threads waiting for the GIL get it sooner, which bounds the interlock latency
+	sys.setswitchinterval(0.001)
+	try:
+		sensors, pwmdriver = open_devices(config)
+	except serial.SerialException as e:
+		status.put(('serial', e.errno, e.strerror))
+		return
+	except ValueError as e:
+		status.put(('value', str(e)))
+		return
+	buffer = RingBuffer(shm_name)
+	raw = RingBuffer(raw_name)
+	# The rows before the start belong to the archive of the previous run
+	buffer.meta[ARCHIVED] = buffer.count()
+	archive = ArchiveWriter(archive_path, columns)
+	journal = Journal(archive_path, len(columns))
+	acq = Acquisition(sensors, pwmdriver, buffer, raw, archive, journal, commands, events, config['limits'])
+	buffer.meta[TRIPPED] = 0
+	acq.publish_pwm()
+	status.put(('ok',))
+	acq.start()
+	command_thread = threading.Thread(target=acq.command_loop)
+	command_thread.start()
+	try:
+		acq.collect_data()
+	finally:
+		acq.stop = True
+		command_thread.join()
+		acq.close()
+		acq.spill(flush=True)
+		archive.close()
+		journal.close()
+		raw.close()
+		buffer.close()
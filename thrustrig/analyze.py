@@ -0,0 +1,87 @@
+import os
+import json
+import hashlib
+import concurrent.futures
+
+import pandas as pd
+
+from . import metrics
+from .compare import read_run
+from .catalog import summary_keys, step_keys
+
+# Bump when the derived metrics change, older cache entries are then recomputed
+cache_version = 2
+cache_dirname = '.analysis'
+
+def file_hash(path):
+	h = hashlib.sha256()
+	with open(path, 'rb') as f:
+		for block in iter(lambda: f.read(2**20), b''):
+			h.update(block)
+	return h.hexdigest()
+
+def analyze_run(path, cache_dir):
+	# Summary and PWM step table of one run file, from the cache if the file content was analyzed before.
+	# Runs in a worker process
+	digest = file_hash(path)
+	cache_path = os.path.join(cache_dir, digest + '.json')
+	try:
+		with open(cache_path) as f:
+			result = json.load(f)
+		if result['version'] == cache_version:
+			return path, result, True
+	except (OSError, ValueError, KeyError):
+		pass
+	df = read_run(path)
+	result = {
+		'version': cache_version,
+		'hash': digest,
+		# The run files hold naive local times, pandas would take them for UTC
+		'started': pd.to_datetime(df['Timestamp']).iloc[0].to_pydatetime().timestamp() if len(df) > 0 else None,
+		'summary': metrics.summary(df),
+		'steps': metrics.step_table(df).to_dict('records'),
+	}
+	# Written next to the final name first, workers never see a partial entry
+	tmp = f'{cache_path}.{os.getpid()}.tmp'
+	with open(tmp, 'w') as f:
+		json.dump(result, f)
+	os.replace(tmp, cache_path)
+	return path, result, False
+
+def run_files(directory):
+	return sorted(
+		os.path.join(directory, name) for name in os.listdir(directory)
+		if name.endswith('.tra') or (name.endswith('.csv') and name not in ('summary.csv', 'steps.csv'))
+	)
+
+def analyze(directory, jobs=None, progress=None):
+	# Analyzes every run file of directory with a pool of jobs processes (default: one per core).
+	# Returns the summary table, the step table and the number of runs taken from the cache
+	cache_dir = os.path.join(directory, cache_dirname)
+	os.makedirs(cache_dir, exist_ok=True)
+	paths = run_files(directory)
+	results = {}
+	cached = 0
+	with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+		futures = {pool.submit(analyze_run, path, cache_dir): path for path in paths}
+		for future in concurrent.futures.as_completed(futures):
+			try:
+				path, result, hit = future.result()
+			except Exception as e:
+				# A damaged or foreign file doesn't stop the batch
+				if progress is not None:
+					progress(f'{os.path.basename(futures[future])}: skipped ({e})')
+				continue
+			results[path] = result
+			cached += hit
+			if progress is not None:
+				progress(f"{os.path.basename(path)}{' (cached)' if hit else ''}")
+	summary = pd.DataFrame([
+		{'file': os.path.basename(path), 'hash': results[path]['hash'], 'started': results[path]['started'], **results[path]['summary']}
+		for path in paths if path in results
+	], columns=['file', 'hash', 'started'] + summary_keys)
+	steps = pd.DataFrame([
+		{'file': os.path.basename(path), **row}
+		for path in paths if path in results for row in results[path]['steps']
+	], columns=['file'] + step_keys)
+	return summary, steps, cached
@@ -0,0 +1,195 @@
+import os
+import json
+import zlib
+import struct
+
+import numpy as np
+import pandas as pd
+
+from .utils import local_time
+
+# An archive file is a JSON header followed by chunks of rows. Each chunk starts with its row count,
+# size and time range, then holds one compressed block per column
+magic = b'TRA1'
+size_head = struct.Struct('<I')
+chunk_head = struct.Struct('<IIdd')
+level = 6
+# Decimal digits tried for the scaled integer encoding, timestamps have microseconds
+max_digits = 6
+raw = 255
+
+def shuffle(ints):
+	# Bytes of the same significance next to each other, small values leave long runs of zero bytes for zlib
+	return ints.view(np.uint8).reshape(-1, 8).T.tobytes()
+
+def unshuffle(data, nrows, dtype):
+	return np.frombuffer(data, dtype=np.uint8).reshape(8, nrows).T.copy().view(dtype).ravel()
+
+def encode(col):
+	# Readings are decimals with a few digits, stored losslessly as deltas of scaled integers with a mask of the
+	# missing ones. Other columns keep their raw bits
+	col = np.ascontiguousarray(col, dtype='<f8')
+	known = ~np.isnan(col)
+	for digits in range(max_digits + 1):
+		scale = 10.0 ** digits
+		ints = np.where(known, np.round(col * scale), 0)
+		if np.all(np.abs(ints) < 2**53) and np.array_equal(ints[known] / scale, col[known]):
+			deltas = np.diff(ints.astype('<i8'), prepend=0)
+			return bytes([digits]) + zlib.compress(np.packbits(known).tobytes() + shuffle(deltas), level)
+	return bytes([raw]) + zlib.compress(shuffle(col.view('<u8')), level)
+
+def decode(data, nrows):
+	digits = data[0]
+	data = zlib.decompress(data[1:])
+	if digits == raw:
+		return unshuffle(data, nrows, '<f8')
+	masklen = (nrows + 7) // 8
+	known = np.unpackbits(np.frombuffer(data[:masklen], dtype=np.uint8), count=nrows).astype(bool)
+	col = np.cumsum(unshuffle(data[masklen:], nrows, '<i8')) / 10.0 ** digits
+	col[~known] = np.nan
+	return col
+
+class ArchiveWriter:
+	# Appends chunks of rows to an archive file, one writer at a time
+
+	def __init__(self, path, columns, append=False):
+		self.path = path
+		self.columns = columns
+		self.f = None
+		if append:
+			self.f = open(path, 'ab')
+		else:
+			self.clear()
+
+	def clear(self):
+		if self.f is not None:
+			self.f.close()
+		self.f = open(self.path, 'wb')
+		header = json.dumps({'columns': self.columns}).encode()
+		self.f.write(magic + size_head.pack(len(header)) + header)
+		self.f.flush()
+
+	def append(self, rows, sync=False):
+		if len(rows) == 0:
+			return
+		blocks = [encode(rows[:, i]) for i in range(rows.shape[1])]
+		size = sum(size_head.size + len(block) for block in blocks)
+		data = [chunk_head.pack(len(rows), size, rows[:, 0].min(), rows[:, 0].max())]
+		for block in blocks:
+			data += [size_head.pack(len(block)), block]
+		# One write per chunk, readers skip a chunk that is not complete yet
+		self.f.write(b''.join(data))
+		self.f.flush()
+		if sync:
+			os.fsync(self.f.fileno())
+
+	def close(self):
+		if self.f is not None:
+			self.f.close()
+			self.f = None
+
+class Archive:
+	# Reads an archive file. The chunk index (offset, rows, time range) is read from the chunk headers only,
+	# and extended by refresh() while the file grows
+
+	def __init__(self, path):
+		self.path = path
+		self.clear()
+		self.refresh()
+
+	def clear(self):
+		self.columns = None
+		self.end = 0
+		self.offsets = []
+		self.sizes = []
+		self.t_first = []
+		self.t_last = []
+		self.starts = [0]
+
+	def refresh(self):
+		with open(self.path, 'rb') as f:
+			f.seek(0, os.SEEK_END)
+			filesize = f.tell()
+			if filesize < self.end:
+				# Rewritten since the last look
+				self.clear()
+			f.seek(self.end)
+			if self.columns is None:
+				if f.read(len(magic)) != magic:
+					raise ValueError(f'{self.path} is not a thrustrig archive')
+				(size,) = size_head.unpack(f.read(size_head.size))
+				self.columns = json.loads(f.read(size))['columns']
+				self.end = f.tell()
+			while self.end + chunk_head.size <= filesize:
+				nrows, size, t_first, t_last = chunk_head.unpack(f.read(chunk_head.size))
+				if self.end + chunk_head.size + size > filesize:
+					break
+				self.offsets.append(self.end + chunk_head.size)
+				self.sizes.append(nrows)
+				self.t_first.append(t_first)
+				self.t_last.append(t_last)
+				self.starts.append(self.starts[-1] + nrows)
+				self.end += chunk_head.size + size
+				f.seek(self.end)
+
+	def __len__(self):
+		return self.starts[-1]
+
+	def nbytes(self):
+		return self.end
+
+	def read_chunks(self, chunks, cols=None):
+		# Rows of the given chunks, with the given column indexes only
+		cols = range(len(self.columns)) if cols is None else cols
+		out = []
+		with open(self.path, 'rb') as f:
+			for i in chunks:
+				f.seek(self.offsets[i])
+				nrows = self.sizes[i]
+				block = np.empty((nrows, len(cols)))
+				for col in range(len(self.columns)):
+					(size,) = size_head.unpack(f.read(size_head.size))
+					if col in cols:
+						block[:, cols.index(col)] = decode(f.read(size), nrows)
+					else:
+						f.seek(size, os.SEEK_CUR)
+				out.append(block)
+		if not out:
+			return np.empty((0, len(cols)))
+		return np.concatenate(out)
+
+	def read(self, start=0, stop=None, cols=None):
+		# Rows start to stop, only the chunks holding them are decompressed
+		stop = len(self) if stop is None else min(stop, len(self))
+		if start >= stop:
+			return np.empty((0, len(self.columns) if cols is None else len(cols)))
+		starts = np.asarray(self.starts)
+		first = int(np.searchsorted(starts, start, side='right')) - 1
+		last = int(np.searchsorted(starts, stop, side='left'))
+		rows = self.read_chunks(range(first, last), cols)
+		return rows[start - starts[first]:stop - starts[first]]
+
+	def read_time(self, t0=None, t1=None, cols=None):
+		# Rows with a timestamp from t0 up to t1 (POSIX seconds), from the chunks whose time range overlaps
+		t_first = np.asarray(self.t_first)
+		t_last = np.asarray(self.t_last)
+		t0 = -np.inf if t0 is None else t0
+		t1 = np.inf if t1 is None else t1
+		chunks = np.nonzero((t_last >= t0) & (t_first < t1))[0]
+		cols = list(range(len(self.columns))) if cols is None else [0] + [c for c in cols if c != 0]
+		rows = self.read_chunks(chunks, cols)
+		return rows[(rows[:, 0] >= t0) & (rows[:, 0] < t1)]
+
+	def to_dataframe(self, rows, cols=None):
+		names = self.columns if cols is None else [self.columns[c] for c in cols]
+		df = pd.DataFrame(rows, columns=names)
+		if 'Timestamp' in df:
+			df['Timestamp'] = local_time(rows[:, names.index('Timestamp')])
+		return df
+
+def read_dataframe(path, t0=None, t1=None):
+	# Whole archive, or the rows from t0 up to t1, with the timestamps as naive local times like the CSV files
+	archive = Archive(path)
+	if t0 is None and t1 is None:
+		return archive.to_dataframe(archive.read())
+	return archive.to_dataframe(archive.read_time(t0, t1))
@@ -0,0 +1,261 @@
+// Renders the samples pushed by the server (see stream.py) into the graphs of the rig page
+(function () {
+	var source = null;
+	var live = null;
+	var page = null;
+
+	function graphDiv(id) {
+		var el = document.getElementById(id);
+		return el ? el.querySelector('.js-plotly-plot') : null;
+	}
+
+	// Typed arrays from stream.py, {dtype, bdata} with the little-endian values in base64. NaN marks a missing reading
+	function decode(arr) {
+		var bin = atob(arr.bdata);
+		var bytes = new Uint8Array(bin.length);
+		for (var i = 0; i < bin.length; i++) {
+			bytes[i] = bin.charCodeAt(i);
+		}
+		return Array.from(arr.dtype === 'f4' ? new Float32Array(bytes.buffer) : new Float64Array(bytes.buffer));
+	}
+
+	function setProps(id, props) {
+		if (window.dash_clientside && window.dash_clientside.set_props) {
+			window.dash_clientside.set_props(id, props);
+		}
+	}
+
+	// Index of the first time after last. The snapshot a client starts from and the shared messages overlap
+	function firstNew(t, last) {
+		var i = 0;
+		while (i < t.length && t[i] <= last) {
+			i++;
+		}
+		return i;
+	}
+
+	// Rows and spectrum lines wait in page.pending until the next redraw of their graph
+
+	function queueRows(msg) {
+		var t = decode(msg.t);
+		var ys = msg.y.map(decode);
+		var skip = msg.reset ? 0 : firstNew(t, page.lastT);
+		t = t.slice(skip);
+		if (msg.reset) {
+			page.lastT = -Infinity;
+		}
+		if (t.length > 0) {
+			page.lastT = t[t.length - 1];
+		}
+		page.graphs.forEach(function (id, i) {
+			var p = page.pending[id];
+			var y = ys[i].slice(skip);
+			if (msg.reset) {
+				page.pending[id] = {reset: true, t: t, y: y};
+			} else if (t.length > 0) {
+				// More than the window would be cut by extendTraces anyway
+				p.t = p.t.concat(t).slice(-page.window);
+				p.y = p.y.concat(y).slice(-page.window);
+			}
+		});
+	}
+
+	function queueSpectrum(spec) {
+		var f = decode(spec.f);
+		var t = decode(spec.t);
+		var flat = decode(spec.z);
+		var z = t.map(function (_, i) {
+			return flat.slice(i * f.length, (i + 1) * f.length);
+		});
+		var peakHz = decode(spec.peak);
+		var rotHz = decode(spec.rot);
+		var skip = spec.reset ? 0 : firstNew(t, page.lastSpecT);
+		if (spec.reset) {
+			page.lastSpecT = -Infinity;
+		}
+		if (t.length > skip) {
+			page.lastSpecT = t[t.length - 1];
+		}
+		var p = page.pending.specgraph;
+		if (spec.reset) {
+			page.pending.specgraph = {reset: true, f: f, t: t, z: z, peak: peakHz, rot: rotHz};
+		} else if (t.length > skip) {
+			p.f = f;
+			p.t = p.t.concat(t.slice(skip)).slice(-page.lines);
+			p.z = p.z.concat(z.slice(skip)).slice(-page.lines);
+			p.peak = p.peak.concat(peakHz.slice(skip)).slice(-page.lines);
+			p.rot = p.rot.concat(rotHz.slice(skip)).slice(-page.lines);
+		}
+	}
+
+	function emptySpectrum() {
+		return {reset: false, f: [], t: [], z: [], peak: [], rot: []};
+	}
+
+	function drawGraph(id) {
+		var p = page.pending[id];
+		var gd = graphDiv(id);
+		if (!gd || (!p.reset && p.t.length === 0)) {
+			return;
+		}
+		var title = ((gd.layout.title && gd.layout.title.text) || '').split('\t')[0];
+		var last = p.reset ? null : gd.data[0].y[gd.data[0].y.length - 1];
+		if (p.y.length > 0) {
+			last = p.y[p.y.length - 1];
+		}
+		if (p.reset) {
+			Plotly.restyle(gd, {x: [p.t], y: [p.y]}, [0]);
+		} else {
+			Plotly.extendTraces(gd, {x: [p.t], y: [p.y]}, [0], page.window);
+		}
+		Plotly.relayout(gd, {'title.text': Number.isFinite(last) ? title + '\t' + last.toFixed(2) : title});
+		page.pending[id] = {reset: false, t: [], y: []};
+	}
+
+	// Waterfall of the thrust spectrum and the peak frequency against the rotation frequency
+	function drawSpectrum() {
+		var p = page.pending.specgraph;
+		var gd = graphDiv('specgraph');
+		var peak = graphDiv('peakgraph');
+		if (!gd || !peak || (!p.reset && p.t.length === 0)) {
+			return;
+		}
+		if (p.reset) {
+			Plotly.restyle(gd, {x: [p.f], y: [p.t], z: [p.z]}, [0]);
+			Plotly.restyle(peak, {x: [p.t, p.t], y: [p.peak, p.rot]}, [0, 1]);
+		} else {
+			if (gd.data[0].x.length !== p.f.length) {
+				// First lines after a reset, or the sensor rate changed
+				Plotly.restyle(gd, {x: [p.f]}, [0]);
+			}
+			Plotly.extendTraces(gd, {y: [p.t], z: [p.z]}, [0], page.lines);
+			Plotly.extendTraces(peak, {x: [p.t, p.t], y: [p.peak, p.rot]}, [0, 1], page.lines);
+		}
+		page.pending.specgraph = emptySpectrum();
+	}
+
+	// Each graph is redrawn at its own period from the rig config, and only while it is in view
+	function draw(id) {
+		if (!page.visible[id]) {
+			return;
+		}
+		if (id === 'specgraph') {
+			drawSpectrum();
+		} else {
+			drawGraph(id);
+		}
+	}
+
+	function render(msg) {
+		if (msg.t !== undefined) {
+			queueRows(msg);
+			setProps('data-mem', {children: msg.mem});
+		}
+		if (msg.spec !== undefined) {
+			queueSpectrum(msg.spec);
+		}
+		if (msg.stats !== undefined) {
+			setProps('stats-data', {data: msg.stats});
+		}
+		if (msg.quality !== undefined) {
+			setProps('quality-msg', {children: msg.quality});
+		}
+		if (msg.devices !== undefined) {
+			setProps('device-msg', {children: msg.devices});
+		}
+		if (msg.trip !== undefined) {
+			setProps('trip-msg', {children: msg.trip});
+			setProps('trip-alert', {is_open: msg.trip !== null});
+		}
+		if (msg.pwm !== undefined) {
+			setProps('pwm-val', {children: String(msg.pwm)});
+			if (msg.ramp !== page.ramp) {
+				// Only changes reach the server
+				page.ramp = msg.ramp;
+				setProps('ramp-state', {data: msg.ramp});
+			}
+		}
+	}
+
+	function newPage(el) {
+		var p = {
+			graphs: el.dataset.graphs.split(','),
+			window: parseInt(el.dataset.window),
+			lines: parseInt(el.dataset.lines),
+			refresh: JSON.parse(el.dataset.refresh),
+			ramp: null,
+			lastT: -Infinity,
+			lastSpecT: -Infinity,
+			pending: {specgraph: emptySpectrum()},
+			visible: {},
+			timers: [],
+			observer: null
+		};
+		p.graphs.forEach(function (id) {
+			p.pending[id] = {reset: false, t: [], y: []};
+		});
+		p.observer = new IntersectionObserver(function (entries) {
+			entries.forEach(function (entry) {
+				p.visible[entry.target.id] = entry.isIntersecting;
+			});
+		});
+		Object.keys(p.refresh).forEach(function (id) {
+			var el = document.getElementById(id);
+			if (el !== null) {
+				p.observer.observe(el);
+			}
+			p.timers.push(setInterval(function () {
+				draw(id);
+			}, p.refresh[id]));
+		});
+		return p;
+	}
+
+	function closePage() {
+		if (source !== null) {
+			source.close();
+			source = null;
+		}
+		if (page !== null) {
+			page.timers.forEach(clearInterval);
+			page.observer.disconnect();
+			page = null;
+		}
+		live = null;
+	}
+
+	// Connect once the graphs of a rig page are drawn, reconnect when another page is rendered. Nothing is
+	// received while the tab is hidden or a dialog is open: the stream is closed, and the server builds no
+	// messages for a rig nobody watches. The first message after reconnecting holds the whole picture
+	function connect() {
+		var el = document.getElementById('live');
+		if (el !== live) {
+			closePage();
+			if (el === null || typeof Plotly === 'undefined') {
+				return;
+			}
+			var ready = el.dataset.graphs.split(',').every(function (id) {
+				var gd = graphDiv(id);
+				return gd !== null && gd.data !== undefined;
+			});
+			if (!ready) {
+				return;
+			}
+			live = el;
+			page = newPage(el);
+		}
+		var active = document.visibilityState === 'visible' && !document.body.classList.contains('modal-open');
+		if (!active && source !== null) {
+			source.close();
+			source = null;
+		} else if (active && source === null) {
+			source = new EventSource(el.dataset.src);
+			source.onmessage = function (e) {
+				render(JSON.parse(e.data));
+			};
+		}
+	}
+
+	document.addEventListener('visibilitychange', connect);
+	setInterval(connect, 500);
+})();
@@ -0,0 +1,155 @@
+import os
+import json
+import sqlite3
+import threading
+from contextlib import closing
+
+from . import metrics
+
+schema = '''
+create table if not exists runs (
+	id integer primary key,
+	rig text not null,
+	started real not null,
+	stopped real,
+	motor text,
+	prop text,
+	tags text,
+	config text,
+	ramps text,
+	archive text,
+	samples integer,
+	duration real,
+	max_thrust real,
+	max_current real,
+	max_power real,
+	max_coil_temp real,
+	max_rpm real,
+	peak_pwm real,
+	energy_wh real
+);
+create index if not exists runs_rig on runs (rig, started);
+create index if not exists runs_motor on runs (motor);
+create index if not exists runs_prop on runs (prop);
+create index if not exists runs_peak_pwm on runs (peak_pwm);
+create index if not exists runs_max_thrust on runs (max_thrust);
+create table if not exists steps (
+	run_id integer not null references runs (id) on delete cascade,
+	pwm integer not null,
+	samples integer,
+	thrust real,
+	voltage real,
+	current real,
+	power real,
+	rpm real,
+	efficiency real,
+	primary key (run_id, pwm)
+);
+create index if not exists steps_pwm on steps (pwm, efficiency);
+'''
+
+summary_keys = ['samples', 'duration', 'max_thrust', 'max_current', 'max_power', 'max_coil_temp', 'max_rpm', 'peak_pwm', 'energy_wh']
+step_keys = ['pwm', 'samples', 'thrust', 'voltage', 'current', 'power', 'rpm', 'efficiency']
+
+class Catalog:
+	# SQLite index of the recorded runs, their metadata and summary stats
+
+	def __init__(self, root):
+		self.root = root
+		self.path = os.path.join(root, 'catalog.db')
+		self.lock = threading.Lock()
+		os.makedirs(root, exist_ok=True)
+		with self.connect() as db:
+			db.executescript(schema)
+
+	def connect(self):
+		db = sqlite3.connect(self.path, timeout=10)
+		db.row_factory = sqlite3.Row
+		return closing(db)
+
+	def execute(self, sql, params=()):
+		with self.lock, self.connect() as db:
+			with db:
+				cur = db.execute(sql, params)
+			return cur.lastrowid, [dict(row) for row in cur.fetchall()]
+
+	def start_run(self, rig_name, started, config, motor=None, prop=None, tags=None, archive=None):
+		runid, _ = self.execute(
+			'insert into runs (rig, started, motor, prop, tags, config, archive) values (?, ?, ?, ?, ?, ?, ?)',
+			(rig_name, started, motor or None, prop or None, tags or None, json.dumps(config), archive)
+		)
+		return runid
+
+	def update_ramps(self, runid, ramps):
+		# The ramp profile of a run while it records, so an unfinished run keeps it
+		self.execute('update runs set ramps = ? where id = ?', (json.dumps(ramps), runid))
+
+	def unfinished_runs(self, rig):
+		# Runs that were never stopped, the process died while they were recording
+		_, rows = self.execute('select * from runs where rig = ? and stopped is null order by started', (rig,))
+		return rows
+
+	def delete_run(self, runid):
+		with self.lock, self.connect() as db:
+			with db:
+				db.execute('delete from steps where run_id = ?', (runid,))
+				db.execute('delete from runs where id = ?', (runid,))
+
+	def finish_run(self, runid, stopped, df, ramps, archive):
+		# Stores the summary and the PWM step table computed from the run data
+		summary = metrics.summary(df)
+		steps = metrics.step_table(df)
+		with self.lock, self.connect() as db:
+			with db:
+				db.execute(
+					'update runs set stopped = ?, ramps = ?, archive = ?, ' + ', '.join(f'{k} = ?' for k in summary_keys) + ' where id = ?',
+					[stopped, json.dumps(ramps), archive] + [summary[k] for k in summary_keys] + [runid]
+				)
+				db.execute('delete from steps where run_id = ?', (runid,))
+				db.executemany(
+					f'insert into steps (run_id, {", ".join(step_keys)}) values (?, {", ".join("?" * len(step_keys))})',
+					[[runid] + [None if v != v else v for v in row] for row in steps[step_keys].itertuples(index=False)]
+				)
+
+	def find_runs(self, rig=None, motor=None, prop=None, peak_pwm=None, since=None, finished=True):
+		where = []
+		params = []
+		for col, val in (('rig', rig), ('motor', motor), ('prop', prop), ('peak_pwm', peak_pwm)):
+			if val is None:
+				continue
+			if isinstance(val, (list, tuple)):
+				where.append(f'{col} in ({", ".join("?" * len(val))})')
+				params.extend(val)
+			else:
+				where.append(f'{col} = ?')
+				params.append(val)
+		if since is not None:
+			where.append('started >= ?')
+			params.append(since)
+		if finished:
+			where.append('stopped is not null')
+		sql = 'select * from runs'
+		if where:
+			sql += ' where ' + ' and '.join(where)
+		_, rows = self.execute(sql + ' order by started desc', params)
+		return rows
+
+	def get_run(self, runid):
+		_, rows = self.execute('select * from runs where id = ?', (runid,))
+		return rows[0] if rows else None
+
+	def steps(self, runids=None, pwm=None):
+		# PWM step table of the given runs, or of all runs
+		where = []
+		params = []
+		if runids is not None:
+			where.append(f'run_id in ({", ".join("?" * len(runids))})')
+			params.extend(runids)
+		if pwm is not None:
+			where.append('pwm = ?')
+			params.append(pwm)
+		sql = 'select steps.*, runs.rig, runs.motor, runs.prop from steps join runs on runs.id = steps.run_id'
+		if where:
+			sql += ' where ' + ' and '.join(where)
+		_, rows = self.execute(sql + ' order by run_id, pwm', params)
+		return rows
@@ -0,0 +1,92 @@
+import os
+import json
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from . import metrics
+from .archive import read_dataframe
+from .utils import SizedCache
+
+# Common grids all runs are resampled onto, so the cached curves of a run fit any selection
+pwm_grid = np.arange(1000, 2001, 10, dtype=np.float64)
+time_step = 0.5
+max_points = 2000
+
+def nbytes(val):
+	if isinstance(val, pd.DataFrame):
+		return int(val.memory_usage(deep=True).sum())
+	return sum(arr.nbytes for arr in val.values())
+
+# Loaded runs and their curves, the budget is set from the 'cache_mb' config value
+cache = SizedCache(64 * 2**20, nbytes)
+
+def read_run(path):
+	if path.endswith('.csv'):
+		# Runs recorded by older versions
+		return pd.read_csv(path, skipinitialspace=True, parse_dates=['Timestamp'])
+	return read_dataframe(path)
+
+def load_run(path, mtime):
+	# mtime is part of the cache key so a rewritten file is read again
+	return cache.get(('run', path, mtime), lambda: metrics.derive(read_run(path)))
+
+def interp(x, xp, fp):
+	# np.interp over the known values only, NaN outside of their range
+	fp = np.asarray(fp, dtype=np.float64)
+	xp = np.asarray(xp, dtype=np.float64)
+	mask = ~(np.isnan(xp) | np.isnan(fp))
+	if mask.sum() < 2:
+		return np.full(len(x), np.nan)
+	return np.interp(x, xp[mask], fp[mask], left=np.nan, right=np.nan)
+
+def by_pwm(path, mtime):
+	return cache.get(('pwm', path, mtime), lambda: pwm_curves(load_run(path, mtime)))
+
+def pwm_curves(df):
+	# Step means of a run on pwm_grid
+	steps = metrics.step_table(df)
+	return {
+		'x': pwm_grid,
+		'thrust': interp(pwm_grid, steps['pwm'], steps['thrust']),
+		'rpm': interp(pwm_grid, steps['pwm'], steps['rpm']),
+		'efficiency': interp(pwm_grid, steps['pwm'], steps['efficiency']),
+	}
+
+def by_time(path, mtime, t0):
+	return cache.get(('time', path, mtime, t0), lambda: time_curves(load_run(path, mtime), t0))
+
+def time_curves(df, t0):
+	# Readings of a run every time_step seconds from t0 (POSIX seconds) on
+	# The timestamps in the run files are naive local times
+	t = (pd.to_datetime(df['Timestamp']) - pd.Timestamp(datetime.datetime.fromtimestamp(t0))).dt.total_seconds().to_numpy()
+	end = np.nanmax(t) if len(t) > 0 else 0
+	grid = np.arange(0, max(end, 0) + time_step / 2, time_step)
+	return {
+		'x': grid,
+		'thrust': interp(grid, t, df['Thrust (N)']),
+		'rpm': interp(grid, t, df['RPM']),
+		'efficiency': interp(grid, t, df['Efficiency (g/W)']),
+	}
+
+def ramp_start(run):
+	# Time of the first ramp of the run, or its start
+	ramps = json.loads(run['ramps'] or '[]')
+	for ramp in ramps:
+		if 'peak' in ramp:
+			return ramp['t']
+	return run['started']
+
+def curves(run, align):
+	path = run['archive']
+	mtime = os.path.getmtime(path)
+	if align == 'pwm':
+		return by_pwm(path, mtime)
+	return by_time(path, mtime, ramp_start(run))
+
+def decimate(curves_list):
+	# Every k-th point of all the curves, k shared so they stay on a common grid
+	longest = max((len(c['x']) for c in curves_list), default=0)
+	k = max(1, -(-longest // max_points))
+	return [{key: val[::k] for key, val in c.items()} for c in curves_list]
@@ -0,0 +1,90 @@
+import threading
+import time
+import math
+
+# Seconds between two checks for stale sensors
+check_period = 0.005
+
+class Rule:
+	# One limit on a column: 'min'/'max' thresholds, 'rate' (max change per second) or 'stale' (max seconds without a sample)
+
+	def __init__(self, spec, col):
+		self.column = spec['column']
+		self.col = col
+		self.min = spec.get('min')
+		self.max = spec.get('max')
+		self.rate = spec.get('rate')
+		self.stale = spec.get('stale')
+
+	def check(self, val, prev, t):
+		if self.max is not None and val > self.max:
+			return f'{self.column} {val:.2f} above {self.max}'
+		if self.min is not None and val < self.min:
+			return f'{self.column} {val:.2f} below {self.min}'
+		if self.rate is not None and prev is not None and t > prev[0]:
+			rate = (val - prev[1]) / (t - prev[0])
+			if abs(rate) > self.rate:
+				return f'{self.column} changing {rate:.1f}/s, limit {self.rate}/s'
+		return None
+
+class Interlock:
+	# Evaluates the limit rules on every sample as it arrives and calls on_trip(reason, t) once when one fails
+
+	def __init__(self, rules, columns, active_cols, on_trip):
+		self.rules = {}
+		self.stale_rules = []
+		for spec in rules:
+			if spec['column'] not in columns:
+				continue
+			rule = Rule(spec, columns.index(spec['column']))
+			if rule.col not in active_cols:
+				continue
+			self.rules.setdefault(rule.col, []).append(rule)
+			if rule.stale is not None:
+				self.stale_rules.append(rule)
+		self.on_trip = on_trip
+		self.prev = {}
+		self.seen = {}
+		self.started = time.time()
+		self.tripped = None
+		self.lock = threading.Lock()
+
+	def feed(self, cols, vals, t):
+		# Called by the sensor reader threads with the columns and values of one reading
+		for col, val in zip(cols, vals):
+			if val is None or math.isnan(val):
+				continue
+			prev = self.prev.get(col)
+			for rule in self.rules.get(col, []):
+				reason = rule.check(val, prev, t)
+				if reason is not None:
+					self.trip(reason, t)
+			self.prev[col] = (t, val)
+			self.seen[col] = t
+
+	def check_stale(self, now):
+		for rule in self.stale_rules:
+			last = self.seen.get(rule.col, self.started)
+			if now - last > rule.stale:
+				self.trip(f'{rule.column} no sample for {now - last:.2f} s', now)
+
+	def trip(self, reason, t):
+		with self.lock:
+			if self.tripped is not None:
+				return
+			self.tripped = reason
+		self.on_trip(reason, t)
+
+	def clear(self):
+		with self.lock:
+			self.tripped = None
+			self.prev = {}
+			self.seen = {}
+			self.started = time.time()
+
+	def run(self, stopped):
+		# Watchdog loop for the stale rules, the other rules are checked in feed()
+		while not stopped():
+			if self.tripped is None:
+				self.check_stale(time.time())
+			time.sleep(check_period)
@@ -0,0 +1,90 @@
+import os
+import time
+
+import numpy as np
+
+from .archive import Archive, ArchiveWriter
+
+# Seconds between two writes of the pending rows to the journal, the rows lost at most on a power loss
+sync_period = 1.0
+
+def journal_path(archive_path):
+	return archive_path + '.wal'
+
+class Journal:
+	# Write-ahead log of the rows of a run not in its archive yet. Each record is the row number in the archive
+	# followed by the row, written in batches every sync_period seconds
+
+	def __init__(self, archive_path, ncols):
+		self.path = journal_path(archive_path)
+		self.ncols = ncols
+		self.pending = []
+		self.synced = time.time()
+		self.fd = None
+		self.checkpoint(0, np.empty((0, ncols)))
+
+	def append(self, index, row):
+		self.pending.append(np.concatenate(([index], row)))
+		if time.time() - self.synced >= sync_period:
+			self.sync()
+
+	def sync(self):
+		if self.pending:
+			os.write(self.fd, np.array(self.pending, dtype='<f8').tobytes())
+			self.pending = []
+		os.fsync(self.fd)
+		self.synced = time.time()
+
+	def checkpoint(self, index, rows):
+		# The archive holds the rows before index, the journal is replaced by one with the rows from index on
+		records = np.empty((len(rows), self.ncols + 1), dtype='<f8')
+		records[:, 0] = np.arange(index, index + len(rows))
+		records[:, 1:] = rows
+		tmp = self.path + '.tmp'
+		with open(tmp, 'wb') as f:
+			f.write(records.tobytes())
+			f.flush()
+			os.fsync(f.fileno())
+		# Windows can't replace a file that is still open
+		if self.fd is not None:
+			os.close(self.fd)
+			self.fd = None
+		os.replace(tmp, self.path)
+		self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+		self.pending = []
+		self.synced = time.time()
+
+	def close(self):
+		# Called once the archive holds all the rows
+		if self.fd is None:
+			return
+		os.close(self.fd)
+		self.fd = None
+		os.remove(self.path)
+
+def recover(archive_path, columns):
+	# Completes the archive of a run that did not stop cleanly with the rows of its journal, returns the archive
+	try:
+		archive = Archive(archive_path)
+		end = archive.end
+	except (OSError, ValueError, KeyError):
+		# Died before the header was written
+		ArchiveWriter(archive_path, columns).close()
+		archive = Archive(archive_path)
+		end = archive.end
+	# A chunk cut short by the crash is dropped, its rows are still in the journal
+	with open(archive_path, 'r+b') as f:
+		f.truncate(end)
+	path = journal_path(archive_path)
+	if os.path.isfile(path):
+		records = np.fromfile(path, dtype='<f8')
+		records = records[:len(records) // (len(columns) + 1) * (len(columns) + 1)].reshape(-1, len(columns) + 1)
+		_, keep = np.unique(records[:, 0], return_index=True)
+		records = records[keep]
+		records = records[records[:, 0] >= len(archive)]
+		writer = ArchiveWriter(archive_path, columns, append=True)
+		writer.append(records[:, 1:])
+		writer.close()
+		os.remove(path)
+		archive.refresh()
+	return archive
@@ -1,33 +1,36 @@
-import threading
 import datetime
 import time
 import os
-import sys
 import serial
 import json
 import argparse
 import subprocess
 import re
+import atexit
+import functools
+import base64
+import io
+from urllib.parse import quote, unquote
 
 import numpy as np
 import pandas as pd
 
 import dash
 from dash import Dash, dcc, html, Input, Output, State, ctx
-import dash_bootstrap_components as dbc	
+import dash_bootstrap_components as dbc
 import plotly
 import plotly.subplots
 import plotly.graph_objects as go
 
-from .sensors import TemperatureSensor, VoltAmpSensor, ThrustSensor, RPMSensor
-from .pwm_driver import PWMDriver
-
-sensors = []
-pwmdriver = None
-collect_thread = None
-columns = ['Timestamp', 'Coil Temperature (C)', 'Voltage (V)', 'Current (A)', 'Batt Temperature (C)', 'Thrust (N)', 'RPM', 'PWM']
-data = np.ndarray(shape=(0, len(columns)))
-data_lock = threading.Lock()
+from .sensors import ThrustSensor
+from .rig import Rig, columns, rig_config
+from .stream import register_stream, trip_text, memory_text, device_text, stats_values, quality_text
+from .catalog import Catalog
+from . import compare
+from . import stats
+from .pwm_driver import check_wave, sine_sweep
+from . import analyze
+from .utils import safe_name, typed
 
 sigrokcli_dl = 'https://sigrok.org/wiki/Downloads'
 if os.name == 'posix':
@@ -36,175 +39,315 @@ elif os.name == 'nt':
 	sigrokcli_dl = 'https://sigrok.org/wiki/Downloads#windows'
 
 config = {
-	'temp': {
-		'enable': True,
-		'port': '/dev/ttyUSB0',
-		'baudrate': 115200
-	},
-	'batt': {
-		'enable': True,
-		'port': '/dev/ttyUSB1',
-		'baudrate': 115200
-	},
-	'thrust': {
-		'enable': True,
-		'port': '/dev/ttyUSB2',
-		'baudrate': 115200,
-		'offset': 991.5,
-		'scale': 117.6,
-		'senlen': 85,
-		'efflen': 114
-	},
-	'rpm': {
-		'enable': True,
-		'sigrokpath': os.environ['HOME'] + '/sigrok-cli'
+	'rigs': {
+		'Rig 1': rig_config()
 	},
-	'pwm': {
-		'enable': True,
-		'port': '/dev/ttyUSB3',
-		'baudrate': 115200
-	}
+	'runs_dir': os.path.join(os.path.expanduser('~'), 'thrustrig_runs'),
+	'cache_mb': 64
 }
 
-config_path = os.path.join(os.environ['HOME'], 'thrustrig.cfg')
+config_path = os.path.join(os.path.expanduser('~'), 'thrustrig.cfg')
 
 if os.path.isfile(config_path):
 	with open(config_path, 'r') as f:
 		new_config = json.load(f)
-		for key in new_config:
-			config[key].update(new_config[key])
-
-if os.name == 'posix':
-	tmpfile = os.path.join('/tmp', 'tmp.csv')
-elif os.name == 'nt':
-	tmpfile = os.path.join(os.environ['TEMP'], 'tmp.csv')
-
-with open(tmpfile, 'w') as f:
-	f.write(', '.join(columns) + '\n')
-
-stop_thread = False
-last_ts = None
+		if 'rigs' in new_config:
+			config['rigs'] = {name: rig_config(section) for name, section in new_config['rigs'].items()}
+		else:
+			# Single rig config file from older versions
+			config['rigs']['Rig 1'] = rig_config(new_config)
+		for key in ['runs_dir', 'cache_mb']:
+			if key in new_config:
+				config[key] = new_config[key]
+
+compare.cache.max_bytes = config['cache_mb'] * 2**20
+
+# Opened by the commands that need them. The acquisition processes are spawned and import this module again,
+# they must not open the catalog or allocate the ring buffers of every rig
+catalog = None
+rigs = {}
+
+def open_catalog():
+	global catalog
+	if catalog is None:
+		catalog = Catalog(config['runs_dir'])
+	return catalog
+
+def open_rigs():
+	global rigs
+	if not rigs:
+		open_catalog()
+		rigs = {name: Rig(name, section, config['runs_dir'], catalog) for name, section in config['rigs'].items()}
+		atexit.register(close_rigs)
+	return rigs
+
+def close_rigs():
+	for rig in rigs.values():
+		rig.close()
 
 sigchk = {
 	'ok': ({'color': 'green'}, 'bi bi-check-circle-fill me-2'),
 	'err': ({'color': 'red'}, 'bi bi-exclamation-triangle-fill me-2')
 }
 
-def create_app():
-	# Start dash app
-	app = Dash(
-		__name__,
-		assets_folder=os.path.join(os.path.dirname(__file__), 'assets'),
-		external_stylesheets=[dbc.themes.BOOTSTRAP, dbc.icons.BOOTSTRAP]
-	)
-
-	app.layout = html.Div([
-		html.H1('Thrust Rig'),
+# Graph id, title, y axis title and trace name for columns 1 to 6
+graphs = [
+	('tempgraph', 'Coil Temperature vs Time', 'Coil Temperature (C)', 'Coil Temperature'),
+	('voltgraph', 'Voltage vs Time', 'Voltage', 'Voltage'),
+	('ampgraph', 'Current vs Time', 'Current', 'Current'),
+	('batttempgraph', 'Battery Temperature vs Time', 'Battery Temperature (C)', 'Battery Temperature'),
+	('thrustgraph', 'Thrust vs Time', 'Thrust (N)', 'Thrust'),
+	('rpmgraph', 'RPM vs Time', 'RPM', 'RPM'),
+]
+
+# The figures are built and validated once, pages and callbacks reuse the plain dicts
+
+@functools.lru_cache(maxsize=None)
+def graph_figure(title, ytitle, name):
+	# Empty figure, the samples are pushed to the browser by the live stream
+	fig = go.Figure()
+	fig.add_trace(go.Scatter(x=[], y=[], mode='lines', name=name))
+	fig.update_layout(title=title, xaxis_title='Time', yaxis_title=ytitle, xaxis_type='date', uirevision=0)
+	return fig.to_dict()
+
+@functools.lru_cache(maxsize=None)
+def spectrum_figure():
+	fig = go.Figure(go.Heatmap(x=[], y=[], z=[], colorscale='Viridis', colorbar={'title': 'dB'}))
+	fig.update_layout(title='Thrust Spectrum', xaxis_title='Frequency (Hz)', yaxis_title='Time', yaxis_type='date', uirevision=0)
+	return fig.to_dict()
+
+@functools.lru_cache(maxsize=None)
+def peak_figure():
+	fig = go.Figure()
+	fig.add_trace(go.Scatter(x=[], y=[], mode='lines', name='Peak'))
+	fig.add_trace(go.Scatter(x=[], y=[], mode='lines', name='Rotation (RPM / 60)'))
+	fig.update_layout(title='Vibration Peak vs Rotation', xaxis_title='Time', yaxis_title='Frequency (Hz)', xaxis_type='date', uirevision=0)
+	return fig.to_dict()
+
+@functools.lru_cache(maxsize=None)
+def compare_layout_template(title, xtitle, ytitle):
+	return go.Layout(title=title, xaxis_title=xtitle, yaxis_title=ytitle, legend={'orientation': 'h'}).to_plotly_json()
+
+def window_label(span):
+	return f'{span // 60} min' if span % 60 == 0 else f'{span} s'
+
+# Windows of the statistics panel, in the order of Stats.read()
+stats_windows = [window_label(span) for span in stats.windows] + ['Run']
+
+def stats_table(values):
+	# values: per column, the values of stats.fields, None without readings
+	head = html.Tr([html.Th('')] + [html.Th(field) for field in stats.fields])
+	body = [
+		html.Tr([html.Th(name)] + [html.Td('-' if v is None else f'{v:.2f}') for v in row])
+		for name, row in zip(columns[1:], values)
+	]
+	return html.Table([html.Thead(head), html.Tbody(body)], className='stats-table')
+
+def refresh_periods(display):
+	# Milliseconds between two redraws of every graph, the peak graph follows the spectrum
+	ids = [g[0] for g in graphs] + ['specgraph']
+	return {gid: int(1000 * display['graphs'].get(gid, display['refresh_s'])) for gid in ids}
+
+def rig_href(name):
+	return '/rig/' + quote(name)
+
+def get_rig(pathname):
+	if pathname is not None and pathname.startswith('/rig/'):
+		name = unquote(pathname[len('/rig/'):])
+		if name in rigs:
+			return rigs[name]
+	return next(iter(rigs.values()))
+
+def recover_text(rig):
+	if not rig.unfinished:
+		return None
+	run = rig.unfinished[0]
+	started = datetime.datetime.fromtimestamp(run['started']).strftime('%Y-%m-%d %H:%M:%S')
+	return f'The run started {started} did not finish. Restore it from its archive and journal?'
+
+def rig_layout(rig):
+	cfg = rig.config
+	running = rig.running()
+	ramp_active = rig.pwmdriver is not None and rig.pwmdriver.ramp_active
+	pwmval = 0 if rig.pwmdriver is None else rig.pwmdriver.val
+	trip = trip_text(rig.trip_state())
+	# Keep persisted input values separate for every rig
+	persist = rig.name
+
+	return html.Div([
+		dcc.Store(id='rig-name', data=rig.name),
 		html.Div([
 			html.Button('Reset', id='reset', n_clicks=0, className='fancy-button'),
-			html.Button('Start', id='start-stop', n_clicks=0, className='fancy-button'),
+			html.Button('Stop' if running else 'Start', id='start-stop', n_clicks=0, className='fancy-button'),
 			html.Button('Save', id='save', n_clicks=0, className='fancy-button'),
-			html.Button('Config', id='cfg-btn', n_clicks=0, className='fancy-button'),
-			html.Label('', id='data-mem')
+			html.Button('Config', id='cfg-btn', n_clicks=0, className='hide' if running else 'fancy-button'),
+			html.Label('', id='data-mem'),
+			html.Label(device_text(rig.lost_devices()), id='device-msg', className='device-msg')
 		], style={'display': 'inline-block', 'width': '100%', 'text-align': 'center'}),
-		dcc.Interval(id='interval', interval=500, n_intervals=0, disabled=True),
+		dbc.Alert([
+			html.Span(trip, id='trip-msg'),
+			html.Button('Clear', id='clear-trip', n_clicks=0, className='fancy-button'),
+		], id='trip-alert', color='danger', is_open=trip is not None, style={'text-align': 'center'}),
+		dbc.Alert([
+			html.Span(recover_text(rig), id='recover-msg'),
+			html.Button('Restore', id='restore-run', n_clicks=0, className='fancy-button'),
+			html.Button('Discard', id='discard-run', n_clicks=0, className='fancy-button'),
+		], id='recover-alert', color='warning', is_open=bool(rig.unfinished), style={'text-align': 'center'}),
+		dcc.Store(id='ramp-state', data=ramp_active),
+		html.Div(id='live', className='hide', **{
+			'data-src': '/stream/' + quote(rig.name),
+			'data-graphs': ','.join(g[0] for g in graphs),
+			'data-window': rig.buffer.capacity,
+			'data-lines': cfg['spectrum']['lines'],
+			'data-refresh': json.dumps(refresh_periods(cfg['display']))
+		}),
 		dcc.Download(id='download'),
 		html.Br(),
 		html.Br(),
 		dbc.Row([
 			dbc.Col(html.Label('PWM Value: '), style={'text-align': 'right'}),
-			dbc.Col(dcc.Slider(id='pwm-slider', min=1000, max=2000, step=50, value=0, marks={v: str(v) for v in range(1000, 2050, 50)}, disabled=True)),
-			dbc.Col(html.Label('1000', id='pwm-val', style={'display': 'inline-block', 'margin-left': '10px'})),
+			dbc.Col(dcc.Slider(id='pwm-slider', min=1000, max=2000, step=50, value=pwmval, marks={v: str(v) for v in range(1000, 2050, 50)}, disabled=not running or ramp_active)),
+			dbc.Col(html.Label(str(max(pwmval, 1000)), id='pwm-val', style={'display': 'inline-block', 'margin-left': '10px'})),
 		], align='center'),
 		html.Br(),
 		dbc.Row([
 			# PWM Ramp driver
 			dbc.Col([html.Label('PWM Ramp: ', style={'font-size': '1.5em'})], style={'text-align': 'right'}),
 			dbc.Col([html.Label('Peak (1000-2000): ')], style={'text-align': 'right'}),
-			dbc.Col([dcc.Input(id='pwm-peak', type='number', value=200, persistence=True)]),
+			dbc.Col([dcc.Input(id='pwm-peak', type='number', value=1200, min=1000, max=2000, persistence=persist)]),
 			dbc.Col([html.Label('Step size: ')], style={'text-align': 'right'}),
-			dbc.Col([dcc.Input(id='pwm-steps', type='number', value=20, persistence=True)]),
+			dbc.Col([dcc.Input(id='pwm-steps', type='number', value=20, persistence=persist)]),
 			dbc.Col([html.Label('Step duration (s): ')], style={'text-align': 'right'}),
-			dbc.Col([dcc.Input(id='pwm-period', type='number', value=1, persistence=True)]),
-			dbc.Col([html.Button('Start', id='start-ramp', n_clicks=0, className='fancy-button')]),
+			dbc.Col([dcc.Input(id='pwm-period', type='number', value=1, persistence=persist)]),
+			dbc.Col([html.Button('Start', id='start-ramp', n_clicks=0, className='fancy-button', disabled=not running or ramp_active)]),
 			dbc.Col([html.Button('Stop', id='stop-ramp', n_clicks=0, className='fancy-button')]),
-			dcc.Interval(id='ramp-interval', interval=250, n_intervals=0, disabled=True),
+		], align='center'),
+		html.Br(),
+		dbc.Row([
+			# Waveform uploaded to the PWM controller in one batch: a sine sweep or a time/PWM table from a CSV file
+			dbc.Col([html.Label('Waveform: ', style={'font-size': '1.5em'})], style={'text-align': 'right'}),
+			dbc.Col([dcc.RadioItems(id='wave-source', options=[
+				{'label': 'Sine sweep', 'value': 'sweep'},
+				{'label': 'CSV table', 'value': 'csv'}
+			], value='sweep', inline=True, persistence=persist, inputStyle={'margin': '0 5px 0 15px'})]),
+			dbc.Col([dcc.Upload(html.Button('Load CSV', className='fancy-button'), id='wave-upload')]),
+			dbc.Col([html.Label('', id='wave-file')]),
+			dbc.Col([html.Button('Start', id='start-wave', n_clicks=0, className='fancy-button', disabled=not running or ramp_active)]),
+			dbc.Col([html.Button('Abort', id='abort-wave', n_clicks=0, className='fancy-button')]),
+		], align='center'),
+		html.Br(),
+		dbc.Row([
+			dbc.Col([html.Label('Center: ')], style={'text-align': 'right'}),
+			dbc.Col([dcc.Input(id='wave-center', type='number', value=1300, persistence=persist)]),
+			dbc.Col([html.Label('Amplitude: ')], style={'text-align': 'right'}),
+			dbc.Col([dcc.Input(id='wave-amplitude', type='number', value=100, persistence=persist)]),
+			dbc.Col([html.Label('From (Hz): ')], style={'text-align': 'right'}),
+			dbc.Col([dcc.Input(id='wave-f0', type='number', value=0.1, persistence=persist)]),
+			dbc.Col([html.Label('To (Hz): ')], style={'text-align': 'right'}),
+			dbc.Col([dcc.Input(id='wave-f1', type='number', value=2, persistence=persist)]),
+			dbc.Col([html.Label('Duration (s): ')], style={'text-align': 'right'}),
+			dbc.Col([dcc.Input(id='wave-duration', type='number', value=30, persistence=persist)]),
+		], align='center'),
+		dcc.Store(id='wave-table'),
+		html.Br(),
+		dbc.Row([
+			# Run metadata stored in the catalog
+			dbc.Col([html.Label('Motor: ')], style={'text-align': 'right'}),
+			dbc.Col([dcc.Input(id='run-motor', type='text', persistence=persist)]),
+			dbc.Col([html.Label('Prop: ')], style={'text-align': 'right'}),
+			dbc.Col([dcc.Input(id='run-prop', type='text', persistence=persist)]),
+			dbc.Col([html.Label('Tags: ')], style={'text-align': 'right'}),
+			dbc.Col([dcc.Input(id='run-tags', type='text', persistence=persist)]),
 		], align='center'),
 		html.Br(),
 		html.Div([
-			dcc.Graph(id='tempgraph', className='graph'),
-			dcc.Graph(id='voltgraph', className='graph'),
-			dcc.Graph(id='ampgraph', className='graph'),
-			dcc.Graph(id='batttempgraph', className='graph'),
-			dcc.Graph(id='thrustgraph', className='graph'),
-			dcc.Graph(id='rpmgraph', className='graph'),
+			dcc.Graph(id=gid, className='graph', figure=graph_figure(title, ytitle, name)) for gid, title, ytitle, name in graphs
 		], className='graph-panel'),
+		html.Div([
+			dcc.Graph(id='specgraph', className='graph', figure=spectrum_figure()),
+			dcc.Graph(id='peakgraph', className='graph', figure=peak_figure()),
+		], className='graph-panel' if cfg['spectrum']['enable'] else 'hide'),
+		html.Br(),
+		# Rolling statistics, pushed by the live stream
+		dcc.Store(id='stats-data', data=stats_values(rig.stats.read())),
+		html.Div([
+			dcc.RadioItems(
+				id='stats-window',
+				options=[{'label': label, 'value': i} for i, label in enumerate(stats_windows)],
+				value=0,
+				inline=True,
+				persistence=persist,
+				inputStyle={'margin': '0 5px 0 15px'}
+			),
+			html.Div(id='stats-table'),
+			html.Label(quality_text(*rig.stats.read_quality()), id='quality-msg', className='quality-msg'),
+		], className='stats-panel'),
 		dbc.Modal([
-				dbc.ModalHeader(dbc.ModalTitle('Configuration'), close_button=False),
+				dbc.ModalHeader(dbc.ModalTitle(f'Configuration - {rig.name}'), close_button=False),
 				dbc.ModalBody([
 					html.H3('Coil Temperature', style={'margin-top': '20px'}),
 					html.Br(),
-					dcc.Checklist(['Enable'], ['Enable'] if config['temp']['enable'] else [], id='temp-enable', persistence=True),
+					dcc.Checklist(['Enable'], ['Enable'] if cfg['temp']['enable'] else [], id='temp-enable', persistence=persist),
 					html.Br(),
 					html.Label('Port: '),
-					dcc.Input(id='tempport', type='text', value=config['temp']['port'], persistence=True),
+					dcc.Input(id='tempport', type='text', value=cfg['temp']['port'], persistence=persist),
 					html.Br(),
 					html.Label('Baudrate: '),
-					dcc.Input(id='tempbaudrate', type='number', value=config['temp']['baudrate'], persistence=True),
-			
+					dcc.Input(id='tempbaudrate', type='number', value=cfg['temp']['baudrate'], persistence=persist),
+
 					html.H3('Battery', style={'margin-top': '20px'}),
 					html.Br(),
-					dcc.Checklist(['Enable'], ['Enable'] if config['batt']['enable'] else [], id='batt-enable', persistence=True),
+					dcc.Checklist(['Enable'], ['Enable'] if cfg['batt']['enable'] else [], id='batt-enable', persistence=persist),
 					html.Br(),
 					html.Label('Port: '),
-					dcc.Input(id='battport', type='text', value=config['batt']['port'], persistence=True),
+					dcc.Input(id='battport', type='text', value=cfg['batt']['port'], persistence=persist),
 					html.Br(),
 					html.Label('Baudrate: '),
-					dcc.Input(id='battbaudrate', type='number', value=config['batt']['baudrate'], persistence=True),
-			
+					dcc.Input(id='battbaudrate', type='number', value=cfg['batt']['baudrate'], persistence=persist),
+
 					html.H3('Thrust', style={'margin-top': '20px'}),
 					html.Br(),
-					dcc.Checklist(['Enable'], ['Enable'] if config['thrust']['enable'] else [], id='thrust-enable', persistence=True),
+					dcc.Checklist(['Enable'], ['Enable'] if cfg['thrust']['enable'] else [], id='thrust-enable', persistence=persist),
 					html.Br(),
 					html.Label('Port: '),
-					dcc.Input(id='thrustport', type='text', value=config['thrust']['port'], persistence=True),
+					dcc.Input(id='thrustport', type='text', value=cfg['thrust']['port'], persistence=persist),
 					html.Br(),
 					html.Label('Baudrate: '),
-					dcc.Input(id='thrustbaudrate', type='number', value=config['thrust']['baudrate'], persistence=True),
+					dcc.Input(id='thrustbaudrate', type='number', value=cfg['thrust']['baudrate'], persistence=persist),
 					html.Br(),
 					html.Label('Offset: '),
-					dcc.Input(id='thrustoffset', type='number', value=config['thrust']['offset'], persistence=True),
+					dcc.Input(id='thrustoffset', type='number', value=cfg['thrust']['offset'], persistence=persist),
 					html.Button('Tare', id='tare-thrust', n_clicks=0, className='fancy-button'),
 					html.Br(),
 					html.Label('Scale: '),
-					dcc.Input(id='thrustscale', type='number', value=config['thrust']['scale'], persistence=True),
+					dcc.Input(id='thrustscale', type='number', value=cfg['thrust']['scale'], persistence=persist),
 					html.Button('Calibrate', id='calibrate-thrust', n_clicks=0, className='fancy-button', disabled=True),
 					html.Br(),
 					html.Label('Sensor arm length: '),
-					dcc.Input(id='thrustsenlen', type='number', value=config['thrust']['senlen'], persistence=True),
+					dcc.Input(id='thrustsenlen', type='number', value=cfg['thrust']['senlen'], persistence=persist),
 					html.Br(),
 					html.Label('Effector arm length: '),
-					dcc.Input(id='thrustefflen', type='number', value=config['thrust']['efflen'], persistence=True),
-		
+					dcc.Input(id='thrustefflen', type='number', value=cfg['thrust']['efflen'], persistence=persist),
+
 					html.H3('RPM Sensor', style={'margin-top': '20px'}),
 					html.Br(),
-					dcc.Checklist(['Enable'], ['Enable'] if config['rpm']['enable'] else [], id='rpm-enable', persistence=True),
+					dcc.Checklist(['Enable'], ['Enable'] if cfg['rpm']['enable'] else [], id='rpm-enable', persistence=persist),
 					html.Br(),
 					html.Label('Path to sigrok-cli: '),
-					dcc.Input(id='sigrokpath', type='text', value=config['rpm']['sigrokpath'], persistence=True),
+					dcc.Input(id='sigrokpath', type='text', value=cfg['rpm']['sigrokpath'], persistence=persist),
 					html.I(className='bi bi-check-circle-fill me-2', id='sigrok-check', style={'color': 'green'}),
 					html.Br(),
 					html.A('Download sigrok-cli', href=sigrokcli_dl, target='_blank'),
-		
+
 					html.H3('PWM Driver', style={'margin-top': '20px'}),
 					html.Br(),
-					dcc.Checklist(['Enable'], ['Enable'] if config['pwm']['enable'] else [], id='pwm-enable', persistence=True),
+					dcc.Checklist(['Enable'], ['Enable'] if cfg['pwm']['enable'] else [], id='pwm-enable', persistence=persist),
 					html.Br(),
 					html.Label('Port: '),
-					dcc.Input(id='pwmdriverport', type='text', value=config['pwm']['port'], persistence=True),
+					dcc.Input(id='pwmdriverport', type='text', value=cfg['pwm']['port'], persistence=persist),
 					html.Br(),
 					html.Label('Baudrate: '),
-					dcc.Input(id='pwmdriverbaudrate', type='number', value=config['pwm']['baudrate'], persistence=True),
+					dcc.Input(id='pwmdriverbaudrate', type='number', value=cfg['pwm']['baudrate'], persistence=persist),
 				]),
 				dbc.ModalFooter([
 					html.Button('Ok', id='ok-config', n_clicks=0, className='fancy-button'),
@@ -229,129 +372,173 @@ def create_app():
 			keyboard=True,
 		),
 	])
- 
-	def collect_data():
-		global sensors, data, stop_thread, tmpfile, last_ts
-		while not stop_thread:
-			if last_ts is not None and (datetime.datetime.now() - last_ts).total_seconds() < 0.5:
-				time.sleep(0.1)
-				continue
-			timestamp = datetime.datetime.now()
-			readings = []
-			for sensor in sensors:
-				if not sensor.enabled():
-					readings.extend([None] * sensor.n_vals)
-					continue
-				reading = sensor.read()
-				if isinstance(reading, (list, tuple)):
-					readings.extend(reading)
-				else:
-					readings.append(reading)
-			readings.append(None if pwmdriver is None else pwmdriver.val)
-			if len(readings) != len(columns) - 1:
-				continue
-			with data_lock:
-				data = np.vstack([data, np.array([timestamp] + readings)])
-				if len(data) > 1200:
-					with open(tmpfile, 'a') as f:
-						arch = data[:200]
-						data = data[200:]
-						for line in arch:
-							f.write(', '.join(['' if val is None else str(val) for val in line]) + '\n')
-			for sensor in sensors: sensor.flush()
-			last_ts = timestamp
-			
+
+def run_label(run):
+	started = datetime.datetime.fromtimestamp(run['started']).strftime('%Y-%m-%d %H:%M')
+	return ' '.join(str(v) for v in [f"#{run['id']}", run['rig'], started, run['motor'], run['prop'], run['tags']] if v)
+
+def compare_layout():
+	runs = catalog.find_runs()
+	return html.Div([
+		dbc.Row([
+			dbc.Col([html.Label('Runs: ')], width=1, style={'text-align': 'right'}),
+			dbc.Col([dcc.Dropdown(id='compare-runs', options=[{'label': run_label(run), 'value': run['id']} for run in runs], multi=True, persistence=True)], width=7),
+			dbc.Col([dcc.RadioItems(id='compare-align', options=[
+				{'label': 'By PWM step', 'value': 'pwm'},
+				{'label': 'By time since ramp start', 'value': 'time'}
+			], value='pwm', inline=True, persistence=True, inputStyle={'margin': '0 5px 0 15px'})]),
+		], align='center'),
+		html.Br(),
+		html.Div([
+			dcc.Graph(id='compare-thrust', className='graph'),
+			dcc.Graph(id='compare-thrust-rpm', className='graph'),
+			dcc.Graph(id='compare-efficiency', className='graph'),
+		], className='graph-panel'),
+	])
+
+def create_app():
+	open_rigs()
+	# Start dash app
+	app = Dash(
+		__name__,
+		assets_folder=os.path.join(os.path.dirname(__file__), 'assets'),
+		external_stylesheets=[dbc.themes.BOOTSTRAP, dbc.icons.BOOTSTRAP],
+		suppress_callback_exceptions=True
+	)
+
+	app.layout = html.Div([
+		dcc.Location(id='url'),
+		html.H1('Thrust Rig'),
+		html.Div([
+			dcc.Link(name, href=rig_href(name), className='rig-link') for name in rigs
+		] + [
+			dcc.Link('Compare', href='/compare', className='rig-link')
+		], className='rig-nav'),
+		html.Div(id='page'),
+	])
+
+	register_stream(app.server, rigs)
+
+	# Callback to render the page of the selected rig
+	@app.callback(
+		Output('page', 'children'),
+		Input('url', 'pathname')
+	)
+	def render_page(pathname):
+		if pathname == '/compare':
+			return compare_layout()
+		return rig_layout(get_rig(pathname))
+
+	# Callback to overlay the selected runs
+	@app.callback(
+		Output('compare-thrust', 'figure'),
+		Output('compare-thrust-rpm', 'figure'),
+		Output('compare-efficiency', 'figure'),
+		Input('compare-runs', 'value'),
+		Input('compare-align', 'value'),
+	)
+	def update_compare(runids, align):
+		runs = [catalog.get_run(runid) for runid in runids or []]
+		runs = [run for run in runs if run is not None and run['archive'] and os.path.isfile(run['archive'])]
+		curves = compare.decimate([compare.curves(run, align) for run in runs])
+
+		# Plain trace dicts with the curves as typed arrays, nothing to validate or format as decimal text
+		def traces(x, y):
+			return [{'type': 'scatter', 'mode': 'lines', 'x': typed(c[x]), 'y': typed(c[y]), 'name': run_label(run)} for run, c in zip(runs, curves)]
+
+		xtitle = 'PWM' if align == 'pwm' else 'Time since ramp start (s)'
+		return (
+			{'data': traces('x', 'thrust'), 'layout': compare_layout_template(f'Thrust vs {xtitle}', xtitle, 'Thrust (N)')},
+			{'data': traces('rpm', 'thrust'), 'layout': compare_layout_template('Thrust vs RPM', 'RPM', 'Thrust (N)')},
+			{'data': traces('x', 'efficiency'), 'layout': compare_layout_template(f'Efficiency vs {xtitle}', xtitle, 'Efficiency (g/W)')},
+		)
+
 	# Callback to reset the data
 	@app.callback(
-		Output('interval', 'n_intervals'),
+		Output('data-mem', 'children', allow_duplicate=True),
 		Input('reset', 'n_clicks'),
+		State('rig-name', 'data'),
 		prevent_initial_call=True
 	)
-	def reset_data(reset):
-		global data
-		with data_lock:
-			data = np.ndarray(shape=(0, len(columns)))
-	
-		if os.path.isfile(tmpfile):
-			os.remove(tmpfile)
-			with open(tmpfile, 'w') as f:
-				f.write(', '.join(columns) + '\n')
-	
-		return 0
-	
+	def reset_data(reset, rig_name):
+		rigs[rig_name].reset()
+		return memory_text(rigs[rig_name])
+
 	# Callback to start/stop the data collection
 	@app.callback(
 		Output('start-stop', 'children'),
 		Output('cfg-btn', 'className'),
-		Output('interval', 'disabled'),
 		Output('pwm-slider', 'disabled'),
 		Output('pwm-slider', 'value', allow_duplicate=True),
 		Output('pwm-val', 'children', allow_duplicate=True),
 		Output('start-ramp', 'disabled', allow_duplicate=True),
-		Output('ramp-interval', 'disabled', allow_duplicate=True),
+		Output('start-wave', 'disabled', allow_duplicate=True),
 		Output('error-msg', 'children', allow_duplicate=True),
 		Output('error-modal', 'is_open', allow_duplicate=True),
 		Input('start-stop', 'n_clicks'),
+		State('run-motor', 'value'),
+		State('run-prop', 'value'),
+		State('run-tags', 'value'),
+		State('rig-name', 'data'),
 		prevent_initial_call=True
 	)
 	def start_stop(
 		start_stop,
+		motor,
+		prop,
+		tags,
+		rig_name
 		):
-		global sensors, collect_thread, data, stop_thread, pwmdriver
-		if start_stop % 2 == 1:
-			sensors = [
-				TemperatureSensor(config['temp']['port'], config['temp']['baudrate']),
-				VoltAmpSensor(config['batt']['port'], config['batt']['baudrate']),
-				ThrustSensor(
-					config['thrust']['port'],
-					config['thrust']['baudrate'],
-					config['thrust']['offset'],
-					config['thrust']['scale'],
-					config['thrust']['senlen'],
-					config['thrust']['efflen']
-				),
-				RPMSensor(config['rpm']['sigrokpath'])
-			]
+		rig = rigs[rig_name]
+		if not rig.running():
 			try:
-				if config['temp']['enable']:
-					sensors[0].start()
-				if config['batt']['enable']:
-					sensors[1].start()
-				if config['thrust']['enable']:
-					sensors[2].start()
-				if config['rpm']['enable']:
-					sensors[3].start()
-				if config['pwm']['enable']:
-					pwmdriver = PWMDriver(config['pwm']['port'], config['pwm']['baudrate'])
-					pwmdriver.start()
+				rig.start(motor, prop, tags)
 			except serial.SerialException as e:
-				sensors = []
-				pwmdriver = None
-				return 'Start', 'fancy-button', True, True, 1000, '1000', True, True, f'Error opening serial port: {e.strerror}', True
+				return 'Start', 'fancy-button', True, 1000, '1000', True, True, f'Error opening serial port: {e.strerror}', True
 			except ValueError:
-				sensors = []
-				pwmdriver = None
-				return 'Start', 'fancy-button', True, True, 1000, '1000', True, True, 'Check path to sigrok-cli', True
-			collect_thread = threading.Thread(target=collect_data)
-			collect_thread.start()
-			return 'Stop', 'hide', False, False, 1000, '1000', False, True, '', False
+				return 'Start', 'fancy-button', True, 1000, '1000', True, True, 'Check path to sigrok-cli', True
+			return 'Stop', 'hide', False, 1000, '1000', False, False, '', False
 		else:
-			stop_thread = True
-			if collect_thread is not None:
-				collect_thread.join()
-			collect_thread = None
-			stop_thread = False
-			for sensor in sensors: sensor.close()
-			sensors = []
-			if pwmdriver is not None:
-				if pwmdriver.ramp_active:
-					pwmdriver.stop_ramp()
-				pwmdriver.set(1000)
-				time.sleep(0.1)
-				pwmdriver.close()
-				del pwmdriver
-				pwmdriver = None
-			return 'Start', 'fancy-button', True, True, 1000, '1000', True, True, '', False
+			rig.stop()
+			return 'Start', 'fancy-button', True, 1000, '1000', True, True, '', False
+
+	# Callback to show the statistics of the selected window
+	@app.callback(
+		Output('stats-table', 'children'),
+		Input('stats-data', 'data'),
+		Input('stats-window', 'value'),
+	)
+	def show_stats(data, window):
+		return stats_table(data[window or 0])
+
+	# Callback to clear a tripped interlock, PWM commands are ignored until then
+	@app.callback(
+		Output('trip-alert', 'is_open'),
+		Input('clear-trip', 'n_clicks'),
+		State('rig-name', 'data'),
+		prevent_initial_call=True
+	)
+	def clear_trip(n_clicks, rig_name):
+		rigs[rig_name].clear_trip()
+		return False
+
+	# Callback to restore or discard the runs a crash left unfinished, one at a time
+	@app.callback(
+		Output('recover-alert', 'is_open'),
+		Output('recover-msg', 'children'),
+		Input('restore-run', 'n_clicks'),
+		Input('discard-run', 'n_clicks'),
+		State('rig-name', 'data'),
+		prevent_initial_call=True
+	)
+	def recover_run(restore_clicks, discard_clicks, rig_name):
+		rig = rigs[rig_name]
+		if rig.unfinished:
+			if ctx.triggered_id == 'restore-run':
+				rig.restore(rig.unfinished[0])
+			else:
+				rig.discard(rig.unfinished[0])
+		return bool(rig.unfinished), recover_text(rig)
 
 	# Callback to close the error modal
 	@app.callback(
@@ -371,13 +558,16 @@ def create_app():
 		Output('error-msg', 'children'),
 		Input('tare-thrust', 'n_clicks'),
 		State('thrustoffset', 'value'),
+		State('rig-name', 'data'),
 		prevent_initial_call=True
 	)
 	def tare_thrust(
 		n_clicks,
-		offset
+		offset,
+		rig_name
 		):
-		thrustsensor = ThrustSensor(config['thrust']['port'], config['thrust']['baudrate'])
+		cfg = rigs[rig_name].config
+		thrustsensor = ThrustSensor(cfg['thrust']['port'], cfg['thrust']['baudrate'])
 		try:
 			thrustsensor.start()
 		except serial.SerialException as e:
@@ -401,153 +591,151 @@ def create_app():
 		Output('pwm-slider', 'value'),
 		Output('pwm-val', 'children', allow_duplicate=True),
 		Input('pwm-slider', 'value'),
+		State('rig-name', 'data'),
 		prevent_initial_call=True
 	)
-	def update_pwm(val):
-		global pwmdriver
+	def update_pwm(val, rig_name):
+		pwmdriver = rigs[rig_name].pwmdriver
 		if pwmdriver is None:
 			return 1000, '1000'
 		pwmdriver.set(val)
 		return val, str(val)
 
 	@app.callback(
-		Output('start-ramp', 'disabled', allow_duplicate=True),
-		Output('pwm-slider', 'disabled', allow_duplicate=True),
-		Output('ramp-interval', 'disabled', allow_duplicate=True),
+		Output('ramp-state', 'data', allow_duplicate=True),
+		Output('error-msg', 'children', allow_duplicate=True),
+		Output('error-modal', 'is_open', allow_duplicate=True),
 		Input('start-ramp', 'n_clicks'),
 		State('pwm-peak', 'value'),
 		State('pwm-steps', 'value'),
 		State('pwm-period', 'value'),
+		State('rig-name', 'data'),
 		prevent_initial_call=True
 	)
 	def start_ramp(
 		n_clicks,
 		peak,
 		steps,
-		period
+		period,
+		rig_name
 		):
-		global pwmdriver
+		pwmdriver = rigs[rig_name].pwmdriver
 		if pwmdriver is None:
-			return True, True, True
+			return False, '', False
 		if pwmdriver.ramp_active:
+			# Only ends the running ramp, a new one is accepted once the controller reports it stopped
 			pwmdriver.stop_ramp()
-		pwmdriver.ramp(peak, steps, period)
-		return True, True, False
-
+			return False, '', False
+		if pwmdriver.tripped:
+			return False, 'The interlock tripped, clear it before starting a ramp', True
+		# The controls follow what was accepted, the stream only reports changes
+		if not pwmdriver.ramp(peak, steps, period):
+			return False, 'Peak must be between 1000 and 2000, step size and duration 0 or more', True
+		return True, '', False
+
+	# Callback to read a waveform table, time (s) and PWM in the first two columns
 	@app.callback(
-		Output('start-ramp', 'disabled', allow_duplicate=True),
-		Output('pwm-slider', 'disabled', allow_duplicate=True),
-		Output('ramp-interval', 'disabled', allow_duplicate=True),
-		Input('stop-ramp', 'n_clicks'),
+		Output('wave-table', 'data'),
+		Output('wave-file', 'children'),
+		Input('wave-upload', 'contents'),
+		State('wave-upload', 'filename'),
 		prevent_initial_call=True
 	)
-	def stop_ramp(n_clicks):
-		global pwmdriver
-		pwmdriver.stop_ramp()
-		return False, False, True
+	def load_wave(contents, filename):
+		try:
+			text = base64.b64decode(contents.split(',', 1)[1]).decode()
+			df = pd.read_csv(io.StringIO(text), header=None).iloc[:, :2].apply(pd.to_numeric, errors='coerce').dropna()
+		except (ValueError, IndexError, UnicodeDecodeError, pd.errors.ParserError):
+			return None, f'{filename}: not a CSV table'
+		times, vals = df[0].to_numpy(), df[1].to_numpy()
+		error = check_wave(times, vals)
+		if error is not None:
+			return None, f'{filename}: {error}'
+		return {'t': times.tolist(), 'pwm': vals.tolist()}, f'{filename}: {len(times)} points, {times[-1]:.1f} s'
 
-	# Callback to update the PWM value
 	@app.callback(
-		Output('start-ramp', 'disabled', allow_duplicate=True),
-		Output('pwm-slider', 'disabled', allow_duplicate=True),
-		Output('ramp-interval', 'disabled', allow_duplicate=True),
-		Output('pwm-val', 'children', allow_duplicate=True),
-		Input('ramp-interval', 'n_intervals'),
+		Output('ramp-state', 'data', allow_duplicate=True),
+		Output('error-msg', 'children', allow_duplicate=True),
+		Output('error-modal', 'is_open', allow_duplicate=True),
+		Input('start-wave', 'n_clicks'),
+		State('wave-source', 'value'),
+		State('wave-table', 'data'),
+		State('wave-center', 'value'),
+		State('wave-amplitude', 'value'),
+		State('wave-f0', 'value'),
+		State('wave-f1', 'value'),
+		State('wave-duration', 'value'),
+		State('rig-name', 'data'),
 		prevent_initial_call=True
 	)
-	def update_ramp(n_intervals):
-		global pwmdriver
+	def start_wave(
+		n_clicks,
+		source,
+		table,
+		center,
+		amplitude,
+		f0,
+		f1,
+		duration,
+		rig_name
+		):
+		pwmdriver = rigs[rig_name].pwmdriver
 		if pwmdriver is None:
-			return True, True, False, '1000'
-		print(pwmdriver.val)
-		if pwmdriver.ramp_active:
-			return True, True, False, str(pwmdriver.val)
-		return False, False, True, str(pwmdriver.val)
+			return False, '', False
+		if source == 'csv':
+			if table is None:
+				return dash.no_update, 'Load a CSV table first', True
+			times, vals = table['t'], table['pwm']
+		else:
+			if None in (center, amplitude, f0, f1, duration) or duration <= 0:
+				return dash.no_update, 'Fill in the sweep parameters', True
+			times, vals = sine_sweep(center, amplitude, f0, f1, duration)
+		error = check_wave(times, vals)
+		if error is not None:
+			return dash.no_update, error, True
+		if pwmdriver.val > 1000:
+			return dash.no_update, 'Set the PWM to 1000 before uploading a waveform', True
+		return pwmdriver.wave(times, vals), '', False
 
-	def get_curval(val):
-		if val is None:
-			return ''
-		return f'\t{val:.2f}'
+	@app.callback(
+		Output('ramp-state', 'data', allow_duplicate=True),
+		Input('stop-ramp', 'n_clicks'),
+		Input('abort-wave', 'n_clicks'),
+		State('rig-name', 'data'),
+		prevent_initial_call=True
+	)
+	def stop_ramp(n_clicks, abort_clicks, rig_name):
+		pwmdriver = rigs[rig_name].pwmdriver
+		if pwmdriver is not None:
+			pwmdriver.stop_ramp()
+		return False
 
-	# Callback to update the graph
+	# Callback to lock the PWM controls while a ramp or waveform runs, the ramp state is pushed by the live stream
 	@app.callback(
-		Output('tempgraph', 'figure'),
-		Output('voltgraph', 'figure'),
-		Output('ampgraph', 'figure'),
-		Output('batttempgraph', 'figure'),
-		Output('thrustgraph', 'figure'),
-		Output('rpmgraph', 'figure'),
-		Output('data-mem', 'children'),
-		Input('interval', 'n_intervals'),
+		Output('start-ramp', 'disabled', allow_duplicate=True),
+		Output('pwm-slider', 'disabled', allow_duplicate=True),
+		Output('start-wave', 'disabled', allow_duplicate=True),
+		Input('ramp-state', 'data'),
+		State('rig-name', 'data'),
+		prevent_initial_call=True
 	)
-	def update_graphs(id):
-		global sensors, data, data_lock
-	
-		tempfig = go.Figure()
-		voltfig = go.Figure()
-		ampfig = go.Figure()
-		batttempfig = go.Figure()
-		thrustfig = go.Figure()
-		rpmfig = go.Figure()
-
-		with data_lock:
-			if len(data) == 0:
-				ts = np.array([])
-				temps = np.array([])
-				voltages = np.array([])
-				currents = np.array([])
-				batt_temps = np.array([])
-				thrusts = np.array([])
-				rpms = np.array([])
-			else:
-				npd = np.array(data)
-				ts = npd[:, 0]
-				temps = npd[:, 1]
-				voltages = npd[:, 2]
-				currents = npd[:, 3]
-				batt_temps = npd[:, 4]
-				thrusts = npd[:, 5]
-				rpms = npd[:, 6]
-	
-		tempfig.add_trace(go.Line(x=ts, y=temps, mode='lines', name='Coil Temperature'))
-		voltfig.add_trace(go.Line(x=ts, y=voltages, mode='lines', name='Voltage'))
-		ampfig.add_trace(go.Line(x=ts, y=currents, mode='lines', name='Current'))
-		batttempfig.add_trace(go.Line(x=ts, y=batt_temps, mode='lines', name='Battery Temperature'))
-		thrustfig.add_trace(go.Line(x=ts, y=thrusts, mode='lines', name='Thrust'))
-		rpmfig.add_trace(go.Line(x=ts, y=rpms, mode='lines', name='RPM'))
-		
-		curtemp = '' if len(temps) == 0 else get_curval(temps[-1])
-		curvolt = '' if len(voltages) == 0 else get_curval(voltages[-1])
-		curamp = '' if len(currents) == 0 else get_curval(currents[-1])
-		curbatttemp = '' if len(batt_temps) == 0 else get_curval(batt_temps[-1])
-		curthrust = '' if len(thrusts) == 0 else get_curval(thrusts[-1])
-		currpm = '' if len(rpms) == 0 else get_curval(rpms[-1])
-
-		voltfig.update_layout(title=f'Voltage vs Time{curvolt}', xaxis_title='Time', yaxis_title='Voltage', uirevision=0)
-		ampfig.update_layout(title=f'Current vs Time{curamp}', xaxis_title='Time', yaxis_title='Current', uirevision=0)
-		batttempfig.update_layout(title=f'Battery Temperature vs Time{curbatttemp}', xaxis_title='Time', yaxis_title='Battery Temperature (C)', uirevision=0)
-		tempfig.update_layout(title=f'Coil Temperature vs Time{curtemp}', xaxis_title='Time', yaxis_title='Coil Temperature (C)', uirevision=0)
-		thrustfig.update_layout(title=f'Thrust vs Time{curthrust}', xaxis_title='Time', yaxis_title='Thrust (N)', uirevision=0)
-		rpmfig.update_layout(title=f'RPM vs Time{currpm}', xaxis_title='Time', yaxis_title='RPM', uirevision=0)
-	
-		with data_lock:
-			mem_used = sys.getsizeof(data) / 1024
-		return tempfig, voltfig, ampfig, batttempfig, thrustfig, rpmfig, f'Memory used: {mem_used:.2f} KB'
+	def update_ramp(ramp_active, rig_name):
+		if rigs[rig_name].pwmdriver is None:
+			return True, True, True
+		return ramp_active, ramp_active, ramp_active
 
 	# Callback to save the data
 	@app.callback(
 		Output('download', 'data'),
-		Input('save', 'n_clicks')
+		Input('save', 'n_clicks'),
+		State('rig-name', 'data'),
+		prevent_initial_call=True
 	)
-	def save(n_clicks):
-		global data
+	def save(n_clicks, rig_name):
+		rig = rigs[rig_name]
 		if n_clicks:
-			tmpdf = pd.read_csv(tmpfile)
-			df = pd.DataFrame(data, columns=columns)
-			if len(tmpdf) > 0:
-				df = pd.concat([tmpdf, df])
-			csv_str = df.to_csv(index=False)
-			return dict(content=csv_str, filename='data.csv')
+			csv_str = rig.to_dataframe().to_csv(index=False)
+			return dict(content=csv_str, filename=f'{safe_name(rig.name)}.csv')
 
 	# Callback to show the configuration modal
 	@app.callback(
@@ -610,7 +798,8 @@ def create_app():
 		Input('sigrokpath', 'value'),
 		Input('pwm-enable', 'value'),
 		Input('pwmdriverport', 'value'),
-		Input('pwmdriverbaudrate', 'value')
+		Input('pwmdriverbaudrate', 'value'),
+		State('rig-name', 'data')
 	)
 	def update_config(
 		tempenable,
@@ -630,32 +819,33 @@ def create_app():
 		sigrokpath,
 		pwmenable,
 		pwmdriverport,
-		pwmdriverbaudrate
+		pwmdriverbaudrate,
+		rig_name
 		):
-		global config
+		cfg = rigs[rig_name].config
 
-		config['temp']['enable'] = 'Enable' in tempenable
-		config['temp']['port'] = tempport
-		config['temp']['baudrate'] = tempbaudrate
+		cfg['temp']['enable'] = 'Enable' in tempenable
+		cfg['temp']['port'] = tempport
+		cfg['temp']['baudrate'] = tempbaudrate
 
-		config['batt']['enable'] = 'Enable' in battenable
-		config['batt']['port'] = battport
-		config['batt']['baudrate'] = battbaudrate
+		cfg['batt']['enable'] = 'Enable' in battenable
+		cfg['batt']['port'] = battport
+		cfg['batt']['baudrate'] = battbaudrate
 
-		config['thrust']['enable'] = 'Enable' in thrustenable
-		config['thrust']['port'] = thrustport
-		config['thrust']['baudrate'] = thrustbaudrate
-		config['thrust']['offset'] = thrustoffset
-		config['thrust']['scale'] = thrustscale
-		config['thrust']['senlen'] = thrustsenlen
-		config['thrust']['efflen'] = thrustefflen
+		cfg['thrust']['enable'] = 'Enable' in thrustenable
+		cfg['thrust']['port'] = thrustport
+		cfg['thrust']['baudrate'] = thrustbaudrate
+		cfg['thrust']['offset'] = thrustoffset
+		cfg['thrust']['scale'] = thrustscale
+		cfg['thrust']['senlen'] = thrustsenlen
+		cfg['thrust']['efflen'] = thrustefflen
 
-		config['rpm']['enable'] = 'Enable' in rpmenable
-		config['rpm']['sigrokpath'] = sigrokpath
+		cfg['rpm']['enable'] = 'Enable' in rpmenable
+		cfg['rpm']['sigrokpath'] = sigrokpath
 
-		config['pwm']['enable'] = 'Enable' in pwmenable
-		config['pwm']['port'] = pwmdriverport
-		config['pwm']['baudrate'] = pwmdriverbaudrate
+		cfg['pwm']['enable'] = 'Enable' in pwmenable
+		cfg['pwm']['port'] = pwmdriverport
+		cfg['pwm']['baudrate'] = pwmdriverbaudrate
 
 	@app.callback(
 		Output('sigrok-check', 'style'),
@@ -670,15 +860,91 @@ def create_app():
 
 	return app
 
+def run_headless(names, outdir, motor=None, prop=None, tags=None):
+	# Run the acquisition of the selected rigs without the dashboard until interrupted
+	started = []
+	for name in names:
+		rig = rigs[name]
+		# Nobody to ask, unfinished runs are always restored
+		for run in list(rig.unfinished):
+			print(f"{name}: restored {rig.restore(run)} rows of the unfinished run #{run['id']}")
+		try:
+			rig.start(motor, prop, tags)
+		except serial.SerialException as e:
+			print(f'{name}: error opening serial port: {e.strerror}')
+			continue
+		except ValueError:
+			print(f'{name}: check path to sigrok-cli')
+			continue
+		print(f'{name}: started')
+		started.append(rig)
+	if len(started) == 0:
+		return
+	trips = {}
+	lost = {}
+	try:
+		while True:
+			time.sleep(1)
+			for rig in started:
+				trip = rig.trip_state()
+				if trip is not None and trip is not trips.get(rig.name):
+					print(f'{rig.name}: {trip_text(trip)}')
+				trips[rig.name] = trip
+				devices = rig.lost_devices()
+				if devices.keys() != lost.get(rig.name, {}).keys():
+					print(f'{rig.name}: {device_text(devices) or "all devices reading"}')
+				lost[rig.name] = devices
+	except KeyboardInterrupt:
+		pass
+	for rig in started:
+		rig.stop()
+		path = os.path.join(outdir, f'{safe_name(rig.name)}.csv')
+		rig.to_dataframe().to_csv(path, index=False)
+		print(f'{rig.name}: stopped, data saved to {path}')
+
+def list_runs(rig=None, motor=None, prop=None, peak=None, steps=False):
+	runs = catalog.find_runs(rig=rig, motor=motor, prop=prop, peak_pwm=peak)
+	if len(runs) == 0:
+		print('No runs found')
+		return
+	if steps:
+		df = pd.DataFrame(catalog.steps([run['id'] for run in runs]))
+		print(df[['run_id', 'rig', 'motor', 'prop', 'pwm', 'samples', 'thrust', 'power', 'rpm', 'efficiency']].to_string(index=False))
+		return
+	df = pd.DataFrame(runs)
+	df['started'] = [datetime.datetime.fromtimestamp(t).strftime('%Y-%m-%d %H:%M:%S') for t in df['started']]
+	print(df[['id', 'rig', 'started', 'motor', 'prop', 'tags', 'duration', 'peak_pwm', 'max_thrust', 'max_power', 'energy_wh']].to_string(index=False))
+
+def analyze_runs(directory, outdir, jobs=None):
+	summary, steps, cached = analyze.analyze(directory, jobs, print)
+	# Catalog details of the runs recorded by this installation
+	runs = {os.path.basename(run['archive']): run for run in catalog.find_runs() if run['archive']}
+	for i, key in enumerate(['rig', 'motor', 'prop', 'tags']):
+		summary.insert(3 + i, key, [runs.get(f, {}).get(key) for f in summary['file']])
+	summary['started'] = [None if t is None or t != t else datetime.datetime.fromtimestamp(t).strftime('%Y-%m-%d %H:%M:%S') for t in summary['started']]
+	os.makedirs(outdir, exist_ok=True)
+	summary.to_csv(os.path.join(outdir, 'summary.csv'), index=False)
+	steps.to_csv(os.path.join(outdir, 'steps.csv'), index=False)
+	print(f'{len(summary)} runs analyzed ({cached} unchanged), summary.csv and steps.csv written to {outdir}')
+
 def main():
 
 	# Parse command line arguments
 	parser = argparse.ArgumentParser()
 
-	parser.add_argument('command', choices=['run', 'update'], help='Command to run', default='run')
- 
+	parser.add_argument('command', choices=['run', 'headless', 'runs', 'analyze', 'update'], help='Command to run', default='run')
+	parser.add_argument('dir', nargs='?', help='Directory of run files to analyze (default: the runs directory)')
+	parser.add_argument('--rig', action='append', help='Rig to run in headless mode or to list the runs of (default: all)')
+	parser.add_argument('--out', default='.', help='Output directory for headless mode and analyze')
+	parser.add_argument('--jobs', type=int, help='Worker processes for analyze (default: one per core)')
+	parser.add_argument('--motor', help='Motor of the run (headless) or of the runs to list')
+	parser.add_argument('--prop', help='Prop of the run (headless) or of the runs to list')
+	parser.add_argument('--tags', help='Tags of the run in headless mode')
+	parser.add_argument('--peak', type=int, help='Peak PWM of the runs to list')
+	parser.add_argument('--steps', action='store_true', help='List the PWM step table of the runs')
+
 	args = parser.parse_args()
- 
+
 	# Check for update subcommand
 	if args.command == 'update':
 		# Run git pull on parent directory of thrustrig module
@@ -700,6 +966,24 @@ def main():
 				print('The app has been updated')
 			return
 
+	if args.command == 'headless':
+		open_rigs()
+		for name in args.rig or []:
+			if name not in rigs:
+				parser.error(f'unknown rig: {name}')
+		run_headless(args.rig or list(rigs), args.out, args.motor, args.prop, args.tags)
+		return
+
+	if args.command == 'runs':
+		open_catalog()
+		list_runs(args.rig, args.motor, args.prop, args.peak, args.steps)
+		return
+
+	if args.command == 'analyze':
+		open_catalog()
+		analyze_runs(args.dir or config['runs_dir'], args.out, args.jobs)
+		return
+
 	app = create_app()
 
 	app.run(debug=False)
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+g = 9.80665
+
+def derive(df):
+	# Adds the derived columns to a DataFrame of recorded data
+	df = df.copy()
+	df['Power (W)'] = df['Voltage (V)'] * df['Current (A)']
+	df['Efficiency (g/W)'] = df['Thrust (N)'] * 1000 / g / df['Power (W)'].where(df['Power (W)'] > 0)
+	return df
+
+def summary(df):
+	# Summary stats of one run, keys match the columns of the runs table of the catalog
+	df = derive(df)
+	ts = pd.to_datetime(df['Timestamp'])
+	t = (ts - ts.iloc[0]).dt.total_seconds().to_numpy() if len(df) > 0 else np.array([])
+	p = df['Power (W)'].to_numpy(dtype=np.float64)
+	# Trapezoidal energy over the samples where the power is known on both ends
+	seg = (p[1:] + p[:-1]) / 2 * np.diff(t)
+	energy = np.nansum(seg) / 3600 if len(seg) > 0 else None
+
+	def peak(col):
+		val = df[col].max() if len(df) > 0 else np.nan
+		return None if pd.isna(val) else float(val)
+
+	return {
+		'samples': len(df),
+		'duration': float(t[-1]) if len(t) > 0 else 0.0,
+		'max_thrust': peak('Thrust (N)'),
+		'max_current': peak('Current (A)'),
+		'max_power': peak('Power (W)'),
+		'max_coil_temp': peak('Coil Temperature (C)'),
+		'max_rpm': peak('RPM'),
+		'peak_pwm': peak('PWM'),
+		'energy_wh': energy,
+	}
+
+def step_table(df):
+	# Mean of the readings at every PWM step, keys match the columns of the steps table of the catalog
+	df = derive(df).dropna(subset=['PWM'])
+	steps = df.groupby(df['PWM'].round().astype(int)).agg(
+		samples=('PWM', 'size'),
+		thrust=('Thrust (N)', 'mean'),
+		voltage=('Voltage (V)', 'mean'),
+		current=('Current (A)', 'mean'),
+		power=('Power (W)', 'mean'),
+		rpm=('RPM', 'mean'),
+	)
+	steps['efficiency'] = steps['thrust'] * 1000 / g / steps['power'].where(steps['power'] > 0)
+	return steps.rename_axis('pwm').reset_index()
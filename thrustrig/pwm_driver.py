@@ -1,6 +1,38 @@
 import serial
 import time
 import threading
+import zlib
+
+import numpy as np
+
+# A waveform goes out in one frame: 'wave <points> <crc32>\n' followed by the points, milliseconds since the start
+# and PWM value as little-endian uint32 and uint16. The controller answers 'Wave loaded' or 'Wave error', plays it
+# on 'wstart', reports the applied value with every tick ('PWM: <val>') and 'Wave complete' at the end
+wave_dtype = np.dtype([('ms', '<u4'), ('pwm', '<u2')])
+# Points the controller holds, about 2 s of upload at 115200 baud
+max_wave_points = 4096
+# Points per second of the generated sweeps
+wave_rate = 50
+# Seconds to wait for 'Wave loaded' or 'Wave error', a full frame takes about 2 s at 115200 baud
+wave_reply_timeout = 3.0
+
+def check_wave(times, vals):
+	# Reason the waveform can't be played, or None
+	if len(times) == 0 or len(times) != len(vals):
+		return 'The waveform has no points'
+	if len(times) > max_wave_points:
+		return f'The waveform has more than {max_wave_points} points'
+	if min(vals) < 1000 or max(vals) > 2000:
+		return 'PWM values must be between 1000 and 2000'
+	if times[0] < 0 or np.any(np.diff(times) < 0):
+		return 'Times must start at 0 or later and increase'
+	return None
+
+def sine_sweep(center, amplitude, f0, f1, duration):
+	# Linear chirp from f0 to f1 Hz around center, sampled at wave_rate
+	t = np.arange(int(duration * wave_rate) + 1) / wave_rate
+	phase = 2 * np.pi * (f0 * t + (f1 - f0) * t**2 / (2 * duration))
+	return t, np.round(center + amplitude * np.sin(phase))
 
 class PWMDriver:
 
@@ -14,6 +46,14 @@ class PWMDriver:
 		self.val = 0
 		self.stop = False
 		self.ramp_active = False
+		# The running profile is a waveform rather than a ramp
+		self.wave_active = False
+		self.wave_points = 0
+		# Set when the controller answers an upload, and whether it was accepted
+		self.wave_reply = threading.Event()
+		self.wave_loaded = False
+		# Writes come from the command thread and from the interlock
+		self.lock = threading.Lock()
   
 	def enabled(self):
 		return self.ser is not None
@@ -33,7 +73,8 @@ class PWMDriver:
 		self.val = val
 		if self.enabled():
 			data = f"set {val}\n".encode()
-			self.ser.write(data)
+			with self.lock:
+				self.ser.write(data)
 		return True
 
 	def ramp(self, peak, step, period):
@@ -50,27 +91,88 @@ class PWMDriver:
 		if self.enabled():
 			print(f"ramp {peak} {step} {period*1000}")
 			data = f"ramp {peak} {step} {period*1000}\n".encode()
-			self.ser.write(data)
+			with self.lock:
+				self.ser.write(data)
    
 		return True
 
+	def upload_wave(self, times, vals):
+		# Only with the motor idle, a trip must not wait for the frame to go out. A refused upload leaves no
+		# earlier waveform to start
+		if self.ramp_active:
+			return False
+		self.wave_points = 0
+		if self.val > 1000:
+			return False
+		if check_wave(times, vals) is not None:
+			return False
+		points = np.empty(len(times), dtype=wave_dtype)
+		points['ms'] = np.round(np.asarray(times) * 1000)
+		points['pwm'] = vals
+		data = points.tobytes()
+		self.wave_loaded = False
+		self.wave_reply.clear()
+		if self.enabled():
+			with self.lock:
+				self.ser.write(f"wave {len(points)} {zlib.crc32(data):08x}\n".encode() + data)
+		self.wave_points = len(points)
+		return True
+
+	def wait_loaded(self, timeout=wave_reply_timeout):
+		# True once the controller accepted the last upload, an upload without an answer can't be started
+		if self.enabled() and not (self.wave_reply.wait(timeout) and self.wave_loaded):
+			self.wave_points = 0
+			return False
+		return self.wave_points > 0
+
+	def play_wave(self, times, vals):
+		# Upload and start in one command, only after the controller accepted what was just uploaded
+		return self.upload_wave(times, vals) and self.wait_loaded() and self.start_wave()
+
+	def start_wave(self):
+		# Only a waveform the controller reported loaded
+		if self.ramp_active or self.wave_points == 0 or (self.enabled() and not self.wave_loaded):
+			return False
+		self.ramp_active = True
+		self.wave_active = True
+		if self.enabled():
+			with self.lock:
+				self.ser.write(b"wstart\n")
+		return True
+
 	def stop_ramp(self):
+		# Also aborts a waveform
 		if self.ramp_active:
 			if self.enabled():
-				print("stop")
-				data = "stop \n".encode()
-				self.ser.write(data)
+				data = b"wabort\n" if self.wave_active else "stop \n".encode()
+				with self.lock:
+					self.ser.write(data)
 			self.ramp_active = False
+			self.wave_active = False
+			self.wave_points = 0
 			return True
 
 	def loop(self):
 		while not self.stop:
-			if self.ser.in_waiting > 0:
+			# Every waiting line, a waveform is confirmed tick by tick
+			while self.ser.in_waiting > 0 and not self.stop:
 				line = self.ser.readline().decode().strip()
 				if line.startswith("PWM: "):
 					self.val = int(line[5:])
-				elif line == "Ramp complete":
+				elif line == "Ramp complete" or line == "Wave complete":
+					self.ramp_active = False
+					self.wave_active = False
+					self.wave_points = 0
+				elif line == "Wave loaded":
+					self.wave_loaded = True
+					self.wave_reply.set()
+				elif line == "Wave error":
+					print("waveform rejected by the controller")
 					self.ramp_active = False
+					self.wave_active = False
+					self.wave_points = 0
+					self.wave_loaded = False
+					self.wave_reply.set()
 			time.sleep(0.01)
 
 	def flush(self):
@@ -0,0 +1,19 @@
+import numpy as np
+
+# Flags of the Quality column, four bits per sensor in the order of acquisition.sensor_names
+TIMEOUT = 1		# A read got nothing from the device, longer than its usual interval after the last reading
+DECODE = 2		# A line or frame could not be parsed
+CLAMP = 4		# An out of range reading was replaced
+STALE = 8		# No new reading since the previous row, the value is repeated or missing
+bits = 4
+flag_names = {TIMEOUT: 'timeout', DECODE: 'decode error', CLAMP: 'clamped', STALE: 'stale'}
+
+def sensor_flags(quality, index):
+	# Flags of the sensor at index, for a value or an array of the Quality column
+	return (np.asarray(quality, dtype=np.int64) >> (bits * index)) & (2**bits - 1)
+
+def counts(quality, nsensors):
+	# Rows with each flag set, per sensor
+	quality = np.asarray(quality)
+	quality = quality[~np.isnan(quality)].astype(np.int64)
+	return np.array([[np.count_nonzero(sensor_flags(quality, i) & flag) for flag in flag_names] for i in range(nsensors)])
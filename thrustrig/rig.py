@@ -0,0 +1,419 @@
+import multiprocessing
+import threading
+import queue
+import errno
+import time
+import os
+import copy
+import json
+
+import numpy as np
+import pandas as pd
+import serial
+
+from . import acquisition
+from .acquisition import columns, sample_period
+from .ringbuffer import RingBuffer, ARCHIVED, PWM_ENABLED, PWM_VAL, RAMP_ACTIVE, TRIPPED
+from .archive import Archive, ArchiveWriter
+from . import journal
+from .spectrum import Spectrum, raw_rows
+from .stats import Stats
+from .pwm_driver import check_wave
+from .utils import safe_name, local_time
+
+default_config = {
+	'temp': {
+		'enable': True,
+		'port': '/dev/ttyUSB0',
+		'baudrate': 115200
+	},
+	'batt': {
+		'enable': True,
+		'port': '/dev/ttyUSB1',
+		'baudrate': 115200
+	},
+	'thrust': {
+		'enable': True,
+		'port': '/dev/ttyUSB2',
+		'baudrate': 115200,
+		'offset': 991.5,
+		'scale': 117.6,
+		'senlen': 85,
+		'efflen': 114
+	},
+	'rpm': {
+		'enable': True,
+		'sigrokpath': os.path.join(os.path.expanduser('~'), 'sigrok-cli')
+	},
+	'pwm': {
+		'enable': True,
+		'port': '/dev/ttyUSB3',
+		'baudrate': 115200
+	},
+	'buffer': {
+		'history_s': 600,
+		'budget_mb': None
+	},
+	'spectrum': {
+		'enable': True,
+		'window_s': 10,
+		'segment': 128,
+		'period_s': 1.0,
+		'lines': 120
+	},
+	'display': {
+		'refresh_s': 0.5,
+		'graphs': {
+			'tempgraph': 2.0,
+			'batttempgraph': 2.0
+		}
+	},
+	'limits': {
+		'enable': True,
+		'rules': [
+			{'column': 'Coil Temperature (C)', 'max': 120},
+			{'column': 'Current (A)', 'max': 60},
+			{'column': 'Thrust (N)', 'stale': 2.0}
+		]
+	}
+}
+
+def rig_config(section=None):
+	# Default rig section updated with the values found in a config file
+	cfg = copy.deepcopy(default_config)
+	if section is not None:
+		for key in section:
+			if key in cfg:
+				cfg[key].update(section[key])
+	return cfg
+
+def buffer_rows(config):
+	# Rows of the live window, from the memory budget if there is one, else from the seconds of history
+	if config['buffer'].get('budget_mb'):
+		rows = int(config['buffer']['budget_mb'] * 2**20 / (len(columns) * 8))
+	else:
+		rows = int(config['buffer']['history_s'] / sample_period)
+	return max(rows, 12)
+
+class PWMControl:
+	# Stand-in for the PWMDriver running in the acquisition process
+
+	def __init__(self, buffer, commands, record):
+		self.buffer = buffer
+		self.commands = commands
+		# Adds an entry to the ramp profile of the current run
+		self.record = record
+
+	@property
+	def val(self):
+		return int(self.buffer.meta[PWM_VAL])
+
+	@property
+	def ramp_active(self):
+		return bool(self.buffer.meta[RAMP_ACTIVE])
+
+	@property
+	def tripped(self):
+		return bool(self.buffer.meta[TRIPPED])
+
+	# Checked like PWMDriver does, a command the driver can't take must not reach the acquisition process.
+	# Empty inputs arrive as None
+
+	def set(self, val):
+		if self.ramp_active or self.tripped:
+			return False
+		if not isinstance(val, (int, float)) or val < 1000 or val > 2000:
+			return False
+		self.commands.put(('set', val))
+		return True
+
+	def ramp(self, peak, step, period):
+		if self.ramp_active or self.tripped:
+			return False
+		if not all(isinstance(x, (int, float)) for x in (peak, step, period)):
+			return False
+		if peak < 1000 or peak > 2000 or step < 0 or period < 0:
+			return False
+		self.commands.put(('ramp', peak, step, period))
+		self.record({'t': time.time(), 'peak': peak, 'step': step, 'period': period})
+		return True
+
+	def wave(self, times, vals):
+		# Uploads the waveform in one batch and plays it, the motor must be idle
+		if self.ramp_active or self.tripped or self.val > 1000:
+			return False
+		if check_wave(times, vals) is not None:
+			return False
+		times = [float(t) for t in times]
+		self.commands.put(('play_wave', times, [int(v) for v in vals]))
+		self.record({'t': time.time(), 'wave': len(times), 'duration': times[-1]})
+		return True
+
+	def stop_ramp(self):
+		self.commands.put(('stop_ramp',))
+		self.record({'t': time.time(), 'stop': True})
+		return True
+
+class Rig:
+
+	mp = multiprocessing.get_context('spawn')
+
+	def __init__(self, name, config, archive_dir, catalog=None):
+		self.name = name
+		self.config = config
+		self.archive_dir = archive_dir
+		self.catalog = catalog
+		self.process = None
+		self.commands = None
+		self.events = None
+		self.run = None
+		# Last interlock trip: reason, time and latency from the sample to the motor cutoff
+		self.trip = None
+		self.lost = {}
+		self.buffer = RingBuffer(capacity=buffer_rows(config), ncols=len(columns), readonly=True)
+		# Every raw thrust reading, time and value
+		self.raw = RingBuffer(capacity=raw_rows, ncols=2, readonly=True)
+		self.spectrum = Spectrum(config['spectrum'])
+		# Statistics of the columns before Quality, and the rows flagged in it
+		self.stats = Stats(acquisition.quality_col, acquisition.quality_col, len(acquisition.sensor_names))
+		# Stops the threads following the run in this process
+		self.monitor_stop = None
+		# Archive file of each run since the last reset, with the index of its first row in the buffer
+		self.sessions = []
+		self.archives = {}
+		os.makedirs(archive_dir, exist_ok=True)
+		# Runs left unfinished by a crash, found at startup
+		self.unfinished = [] if catalog is None else catalog.unfinished_runs(name)
+
+	def running(self):
+		return self.process is not None
+
+	@property
+	def pwmdriver(self):
+		if self.process is None or not self.buffer.meta[PWM_ENABLED]:
+			return None
+		return PWMControl(self.buffer, self.commands, self.record)
+
+	def archive_path(self, started):
+		stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(started))
+		return os.path.join(self.archive_dir, f'{safe_name(self.name)}-{stamp}.tra')
+
+	def start(self, motor=None, prop=None, tags=None):
+		# Raises serial.SerialException or ValueError if a device can't be opened
+		started = time.time()
+		path = self.archive_path(started)
+		self.commands = self.mp.Queue()
+		self.events = self.mp.Queue()
+		self.trip = None
+		self.lost = {}
+		status = self.mp.Queue()
+		self.process = self.mp.Process(
+			target=acquisition.run,
+			args=(self.config, self.buffer.name, self.raw.name, path, self.commands, status, self.events),
+			name=f'acquisition-{self.name}',
+			daemon=True
+		)
+		self.process.start()
+		try:
+			res = status.get(timeout=30)
+		except queue.Empty:
+			res = ('serial', errno.ETIMEDOUT, 'acquisition process did not start')
+		if res[0] == 'ok':
+			first = self.buffer.count()
+			self.sessions.append((first, path))
+			self.run = {
+				'id': None if self.catalog is None else self.catalog.start_run(self.name, started, self.config, motor, prop, tags, path),
+				'started': started,
+				'first': first,
+				'archive': path,
+				'ramps': []
+			}
+			self.monitor_stop = threading.Event()
+			self.stats.clear()
+			threading.Thread(target=self.stats.run, args=(self.buffer, self.monitor_stop.is_set), daemon=True).start()
+			if self.config['spectrum']['enable']:
+				threading.Thread(
+					target=self.spectrum.run,
+					args=(self.raw, self.buffer, columns.index('RPM'), self.monitor_stop.is_set),
+					daemon=True
+				).start()
+			return
+		self.process.join(1)
+		if self.process.is_alive():
+			self.process.terminate()
+		self.process = None
+		self.commands = None
+		if res[0] == 'serial':
+			raise serial.SerialException(res[1], res[2])
+		raise ValueError(res[1])
+
+	def stop(self):
+		if self.process is None:
+			return
+		if self.monitor_stop is not None:
+			self.monitor_stop.set()
+			self.monitor_stop = None
+		self.commands.put(('stop',))
+		self.process.join(5)
+		if self.process.is_alive():
+			# A device read is blocking, the devices are released with the process
+			self.process.terminate()
+			self.process.join()
+		if self.process.exitcode != 0:
+			# Killed or crashed, its cleanup may not have run
+			acquisition.release_motor(self.config)
+			self.save_unarchived()
+		self.trip_state()
+		self.process = None
+		self.commands = None
+		self.events = None
+		self.finish_run()
+
+	def save_unarchived(self):
+		# The process was killed before it wrote its last rows. Its archive is recovered like after a crash (torn
+		# chunk cut, journal replayed), then completed with the rows still in the ring the journal didn't have yet
+		if not self.sessions:
+			return
+		first, path = self.sessions[-1]
+		archive = journal.recover(path, columns)
+		_, rows = self.buffer.read(first + len(archive))
+		if len(rows) == 0:
+			return
+		writer = ArchiveWriter(path, columns, append=True)
+		writer.append(rows)
+		writer.close()
+
+	def restore(self, run):
+		# Completes the archive of an unfinished run from its journal and indexes it like a finished run
+		self.unfinished = [r for r in self.unfinished if r['id'] != run['id']]
+		path = run['archive']
+		if path is None or not (os.path.isfile(path) or os.path.isfile(journal.journal_path(path))):
+			self.catalog.delete_run(run['id'])
+			return 0
+		archive = journal.recover(path, columns)
+		rows = archive.read()
+		# Stopped at the last recorded row
+		stopped = rows[-1, 0] if len(rows) > 0 else run['started']
+		self.catalog.finish_run(run['id'], stopped, archive.to_dataframe(rows), json.loads(run['ramps'] or '[]'), path)
+		return len(rows)
+
+	def discard(self, run):
+		self.unfinished = [r for r in self.unfinished if r['id'] != run['id']]
+		for path in [run['archive'], run['archive'] and journal.journal_path(run['archive'])]:
+			if path and os.path.isfile(path):
+				os.remove(path)
+		self.catalog.delete_run(run['id'])
+
+	def record(self, entry):
+		# Ramps, stops, trips and device events of the run, stored right away so a crashed run keeps them
+		run = self.run
+		if run is None:
+			return
+		run['ramps'].append(entry)
+		if self.catalog is not None:
+			self.catalog.update_ramps(run['id'], run['ramps'])
+
+	def finish_run(self):
+		# Indexes the run, its rows are in the archive file written by the acquisition process
+		run = self.run
+		self.run = None
+		if run is None or self.catalog is None:
+			return
+		df = self.to_dataframe(run['first'])
+		self.catalog.finish_run(run['id'], time.time(), df, run['ramps'], run['archive'])
+
+	def poll_events(self):
+		# Interlock trips and lost/recovered devices, recorded with the ramps of the run
+		while self.events is not None:
+			try:
+				event, *args = self.events.get_nowait()
+			except (queue.Empty, OSError, ValueError):
+				break
+			if event == 'trip':
+				reason, t, latency = args
+				self.trip = {'reason': reason, 't': t, 'latency': latency}
+				self.record({'t': t, 'trip': reason})
+			elif event == 'device':
+				name, state, t = args
+				if state == 'lost':
+					self.lost[name] = t
+				else:
+					self.lost.pop(name, None)
+				self.record({'t': t, 'device': name, 'state': state})
+
+	def lost_devices(self):
+		# Devices being reopened, with the time of their last reading
+		self.poll_events()
+		return dict(self.lost) if self.process is not None else {}
+
+	def trip_state(self):
+		# The last trip while the interlock is tripped, else None
+		self.poll_events()
+		if self.process is None or not self.buffer.meta[TRIPPED]:
+			return None
+		return self.trip
+
+	def clear_trip(self):
+		if self.running():
+			self.commands.put(('clear_trip',))
+
+	def reset(self):
+		# Only drops the data from the live view, the archive files of the finished runs are kept
+		if self.running():
+			self.commands.put(('reset',))
+			self.run['first'] = 0
+			self.sessions = [(0, self.run['archive'])]
+		else:
+			self.buffer.clear()
+			self.sessions = []
+		self.archives = {}
+		self.spectrum.clear()
+		self.stats.clear()
+
+	def get_data(self):
+		return self.buffer.read()[1]
+
+	def archive(self, path):
+		# Readers are kept so their chunk index is only extended
+		if path not in self.archives:
+			self.archives[path] = Archive(path)
+		else:
+			self.archives[path].refresh()
+		return self.archives[path]
+
+	def read_archived(self, start, stop):
+		# Rows start to stop from the archive files of the runs holding them
+		parts = []
+		for i, (first, path) in enumerate(self.sessions):
+			end = self.sessions[i + 1][0] if i + 1 < len(self.sessions) else stop
+			if end <= start or first >= stop or not os.path.isfile(path):
+				continue
+			parts.append(self.archive(path).read(max(start, first) - first, min(stop, end) - first))
+		return np.concatenate(parts) if parts else np.empty((0, len(columns)))
+
+	def to_dataframe(self, start=0):
+		# Rows from index start on. The archive is read only up to the rows it had when the rest was taken from the ring
+		archived = int(self.buffer.meta[ARCHIVED])
+		first, rows = self.buffer.read(max(start, archived))
+		rows = np.concatenate([self.read_archived(start, archived), rows])
+		df = pd.DataFrame(rows, columns=columns)
+		df['Timestamp'] = local_time(rows[:, 0])
+		df['Quality'] = df['Quality'].astype('Int64')
+		return df
+
+	def memory(self):
+		# Bytes held by the live window and the spilled archive
+		rows = min(self.buffer.count(), self.buffer.capacity)
+		return {
+			'live_rows': rows,
+			'live_used': rows * self.buffer.ncols * 8,
+			'live_size': self.buffer.nbytes(),
+			'live_history': self.buffer.capacity * sample_period,
+			'archive': sum(os.path.getsize(path) for _, path in self.sessions if os.path.isfile(path)),
+			'archive_rows': int(self.buffer.meta[ARCHIVED]),
+		}
+
+	def close(self):
+		self.stop()
+		self.raw.close()
+		self.buffer.close()
@@ -0,0 +1,73 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Slots of the int64 header in front of the rows
+COUNT = 0		# Rows written since the last clear
+ARCHIVED = 1	# Rows written to the rig's archive
+PWM_ENABLED = 2
+PWM_VAL = 3
+RAMP_ACTIVE = 4
+TRIPPED = 5		# Set by the interlock until cleared
+META_LEN = 8
+
+class RingBuffer:
+	# Fixed size float64 ring of rows in shared memory, one writer process and any number of readers
+
+	def __init__(self, name=None, capacity=None, ncols=None, readonly=False):
+		if name is None:
+			size = META_LEN * 8 + 16 + capacity * ncols * 8
+			self.shm = shared_memory.SharedMemory(create=True, size=size)
+			self.owner = True
+			np.ndarray((2,), dtype=np.int64, buffer=self.shm.buf, offset=META_LEN * 8)[:] = (capacity, ncols)
+		else:
+			self.shm = shared_memory.SharedMemory(name=name)
+			self.owner = False
+		self.name = self.shm.name
+		self.capacity, self.ncols = (int(v) for v in np.ndarray((2,), dtype=np.int64, buffer=self.shm.buf, offset=META_LEN * 8))
+		self.meta = np.ndarray((META_LEN,), dtype=np.int64, buffer=self.shm.buf)
+		self.rows = np.ndarray((self.capacity, self.ncols), dtype=np.float64, buffer=self.shm.buf, offset=META_LEN * 8 + 16)
+		if readonly:
+			self.meta.flags.writeable = False
+			self.rows.flags.writeable = False
+
+	def count(self):
+		return int(self.meta[COUNT])
+
+	def append(self, row):
+		count = int(self.meta[COUNT])
+		self.rows[count % self.capacity] = row
+		# Publish the row only once it is complete
+		self.meta[COUNT] = count + 1
+
+	def read(self, start=0):
+		# Returns the index of the first row and a copy of the rows from start on that are still in the ring
+		count = int(self.meta[COUNT])
+		first = max(start, count - self.capacity)
+		if first >= count:
+			return count, np.ndarray((0, self.ncols))
+		rows = self.rows.take(np.arange(first, count) % self.capacity, axis=0)
+		# Drop the rows the writer overwrote while they were copied, the next slot may be half written
+		lost = int(self.meta[COUNT]) + 1 - self.capacity - first
+		if lost > 0:
+			first += lost
+			rows = rows[lost:]
+		return first, rows
+
+	def clear(self):
+		meta = np.ndarray((META_LEN,), dtype=np.int64, buffer=self.shm.buf)
+		meta[COUNT] = 0
+		meta[ARCHIVED] = 0
+
+	def nbytes(self):
+		return self.meta.nbytes + self.rows.nbytes
+
+	def close(self):
+		if self.shm is None:
+			return
+		self.meta = None
+		self.rows = None
+		self.shm.close()
+		if self.owner:
+			self.shm.unlink()
+		self.shm = None
@@ -2,6 +2,10 @@ import os
 import time
 import subprocess
 from ..utils import time_it
+from ..quality import TIMEOUT, DECODE
+
+# Seconds one sigrok-cli sample may take, the tachometer is given up on after that
+read_timeout = 5.0
 
 class RPMSensor:
 
@@ -10,6 +14,10 @@ class RPMSensor:
 	def __init__(self, sigrokpath):
 		self.sigrokpath = sigrokpath
 		self._enabled = False
+		# The running sigrok-cli, killed on close
+		self.proc = None
+		# Quality flags of the last read
+		self.flags = 0
   
 	def enabled(self):
 		return self._enabled
@@ -24,14 +32,27 @@ class RPMSensor:
 	# @time_it("RPM read")
 	def read(self):
 		val = None
+		self.flags = 0
 		try:
-			results = subprocess.Popen([self.sigrokpath,"--driver=uni-t-ut372:conn=1a86.e008", "--samples=1"], stdout=subprocess.PIPE)
-			out, err = results.communicate()
+			self.proc = subprocess.Popen([self.sigrokpath,"--driver=uni-t-ut372:conn=1a86.e008", "--samples=1"], stdout=subprocess.PIPE)
+			try:
+				out, err = self.proc.communicate(timeout=read_timeout)
+			except subprocess.TimeoutExpired:
+				self.proc.kill()
+				self.proc.wait()
+				self.proc.stdout.close()
+				self.flags = TIMEOUT
+				return None
+			finally:
+				self.proc = None
 			if isinstance(out, bytes):
 				out = out.decode()
+			if not out.strip():
+				self.flags = TIMEOUT
+				return None
 			val = float(out.split(' ')[1])
 		except (ValueError, IndexError):
-			pass
+			self.flags = DECODE
 		return val
 
 	def flush(self):
@@ -39,6 +60,9 @@ class RPMSensor:
 
 	def close(self):
 		self._enabled = False
+		proc = self.proc
+		if proc is not None and proc.poll() is None:
+			proc.kill()
   
 	def __del__(self):
 		self.close()
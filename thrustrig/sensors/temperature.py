@@ -1,39 +1,50 @@
 import serial
 import time
 from ..utils import time_it
+from ..quality import TIMEOUT, DECODE, CLAMP
 
 class TemperatureSensor:
 
 	n_vals = 1
     
-	def __init__(self, port, baudrate):
+	def __init__(self, port, baudrate, timeout = 1.0):
 		self.port = port
 		self.baudrate = baudrate
 		self.ser = None
+		self.timeout = timeout
+		# Quality flags of the last read
+		self.flags = 0
   
 	def enabled(self):
 		return self.ser is not None
 
 	def start(self):
-		self.ser = serial.Serial(self.port, self.baudrate)
+		self.ser = serial.Serial(self.port, self.baudrate, timeout=self.timeout)
 		self.ser.flushInput()
 		self.ser.flushOutput()
 
 	# @time_it("Temp read")
 	def read(self):
 		val = None
+		self.flags = 0
 		try:
 			s = self.ser.readline().decode().strip()
 		except UnicodeDecodeError:
+			self.flags = DECODE
 			return None
-		if len(s) == 0 or s[0] != 'T':
+		if len(s) == 0:
+			self.flags = TIMEOUT
+			return None
+		if s[0] != 'T':
+			self.flags = DECODE
 			return None
 		try:
 			val = float(s[1:]) * 80 / 1000 / 60
 			if val < 25 or val > 300:
 				val = 25
+				self.flags = CLAMP
 		except ValueError:
-			pass
+			self.flags = DECODE
 		return val
 
 	def flush(self):
@@ -1,15 +1,19 @@
 import serial
 import time
 from ..utils import time_it
+from ..quality import TIMEOUT, DECODE
 
 class ThrustSensor:
 
 	n_vals = 1
 
-	def __init__(self, port, baudrate, offset = None, scale = None, senlen = 1, efflen = 1):
+	def __init__(self, port, baudrate, offset = None, scale = None, senlen = 1, efflen = 1, timeout = 1.0):
 		self.port = port
 		self.baudrate = baudrate
 		self.ser = None
+		self.timeout = timeout
+		# Quality flags of the last read
+		self.flags = 0
 		self.offset = offset
 		self.scale = scale
 		self.senlen = senlen
@@ -19,18 +23,24 @@ class ThrustSensor:
 		return self.ser is not None
 
 	def start(self):
-		self.ser = serial.Serial(self.port, self.baudrate)
+		self.ser = serial.Serial(self.port, self.baudrate, timeout=self.timeout)
 		self.ser.flushInput()
 		self.ser.flushOutput()
 
 	# @time_it("Thrust read")
 	def read(self):
 		val = None
+		self.flags = 0
 		try:
 			s = self.ser.readline().decode().strip()
 		except UnicodeDecodeError:
+			self.flags = DECODE
 			return None
-		if len(s) == 0 or s[0] != 'H':
+		if len(s) == 0:
+			self.flags = TIMEOUT
+			return None
+		if s[0] != 'H':
+			self.flags = DECODE
 			return None
 		try:
 			val = float(s[1:])
@@ -38,7 +48,7 @@ class ThrustSensor:
 				val = (val - self.offset) / self.scale
 				val *= self.senlen / self.efflen
 		except ValueError:
-			pass
+			self.flags = DECODE
 		return val
 
 	def flush(self):
@@ -1,6 +1,7 @@
 import serial
 import time
 from ..utils import time_it
+from ..quality import TIMEOUT, DECODE
 
 class VoltAmpSensor:
 
@@ -11,6 +12,8 @@ class VoltAmpSensor:
 		self.baudrate = baudrate
 		self.ser = None
 		self.ser_timeout = ser_timeout
+		# Quality flags of the last read
+		self.flags = 0
   
 	def enabled(self):
 		return self.ser is not None
@@ -22,13 +25,15 @@ class VoltAmpSensor:
   
 	# @time_it("Batt read")
 	def read(self, timeout_s = 0.1):
-		val = None
+		val = None, None, None
 		s = ''
+		self.flags = 0
 		try:
 			# ':r50{data}\n'
 			start = time.time()
 			while True:
 				if time.time() - start > timeout_s:
+					self.flags = TIMEOUT
 					return None, None, None
 				ss = self.ser.read(1).decode('utf-8')
 				if ss == ':':
@@ -39,14 +44,14 @@ class VoltAmpSensor:
 				if s:
 					s += ss
 					if ss == '\n':
-						print(f"Batt got: {s}")
 						break
 		except UnicodeDecodeError:
+			self.flags = DECODE
 			return None, None, None
 		try:
 			val = self.parse(s)
 		except ValueError:
-			pass
+			self.flags = DECODE
 		return val
 
 	def parse(self, s):
@@ -56,8 +61,8 @@ class VoltAmpSensor:
 			voltage = float(parts[2]) / 100
 			current = float(parts[3]) / 100
 			temperature = float(parts[8]) % 100
-		except IndexError as e:
-			print(f"Error in batt data: {s}")
+		except IndexError:
+			self.flags = DECODE
 			return None, None, None
   
 		return voltage, current, temperature
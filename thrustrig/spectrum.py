@@ -0,0 +1,87 @@
+import threading
+import collections
+import time
+
+import numpy as np
+
+# Rows of the ring holding the raw thrust readings, time and value
+raw_rows = 4096
+
+def welch(x, fs, nperseg):
+	# Mean periodogram of the half overlapping Hann windowed segments of x, all segments in one FFT
+	step = nperseg // 2
+	segs = np.lib.stride_tricks.sliding_window_view(x, nperseg)[::step]
+	segs = segs - segs.mean(axis=1, keepdims=True)
+	win = np.hanning(nperseg)
+	psd = (np.abs(np.fft.rfft(segs * win, axis=1)) ** 2).mean(axis=0) / (fs * (win ** 2).sum())
+	# One-sided, the DC and Nyquist bins have no mirror
+	psd[1:(nperseg + 1) // 2] *= 2
+	return np.fft.rfftfreq(nperseg, 1 / fs), psd
+
+class Spectrum:
+	# Waterfall of the thrust PSD over a sliding window, with the peak frequency and the rotation frequency from the RPM
+
+	def __init__(self, config):
+		self.window_s = config['window_s']
+		self.segment = config['segment']
+		self.period = config['period_s']
+		self.lock = threading.Lock()
+		self.lines = collections.deque(maxlen=config['lines'])
+		self.cleared = 0
+		self.clear()
+
+	def clear(self):
+		with self.lock:
+			self.fs = None
+			self.nperseg = None
+			self.freqs = None
+			self.count = 0
+			self.lines.clear()
+			self.cleared += 1
+
+	def state(self):
+		return self.cleared, self.count
+
+	def read(self, start=0):
+		# Index of the first line and the lines (t, PSD in dB, peak Hz, rotation Hz) from start on still kept
+		with self.lock:
+			first = self.count - len(self.lines)
+			return max(start, first), list(self.lines)[max(start - first, 0):]
+
+	def update(self, t, x, rpm):
+		# t, x: raw readings of the window, rpm: the last RPM reading
+		if len(t) < 16 or t[-1] <= t[0]:
+			return
+		fs = (len(t) - 1) / (t[-1] - t[0])
+		if self.fs is not None and abs(fs - self.fs) > 0.1 * self.fs:
+			# The sensor rate changed, the frequency axis with it
+			self.clear()
+		if self.fs is None:
+			self.fs = fs
+			self.nperseg = min(self.segment, max(8, int(self.window_s * fs) // 2 // 2 * 2))
+		n = min(int((t[-1] - t[0]) * self.fs) + 1, int(self.window_s * self.fs))
+		if n < self.nperseg:
+			return
+		# Readings arrive with some jitter, resample them to the sensor rate
+		grid = t[-1] - np.arange(n)[::-1] / self.fs
+		freqs, psd = welch(np.interp(grid, t, x), self.fs, self.nperseg)
+		peak = freqs[1:][np.argmax(psd[1:])]
+		line = (t[-1], np.round(10 * np.log10(psd + 1e-12), 1), peak, rpm / 60)
+		with self.lock:
+			self.freqs = freqs
+			self.lines.append(line)
+			self.count += 1
+
+	def run(self, raw, buffer, rpm_col, stopped):
+		# Thread in the dashboard process, the acquisition process only fills the raw ring
+		seen = raw.count()
+		while not stopped():
+			time.sleep(self.period)
+			count = raw.count()
+			if count == seen:
+				continue
+			seen = count
+			_, rows = raw.read()
+			rows = rows[rows[:, 0] >= rows[-1, 0] - self.window_s]
+			last = buffer.read(max(buffer.count() - 1, 0))[1]
+			self.update(rows[:, 0], rows[:, 1], last[-1, rpm_col] if len(last) > 0 else np.nan)
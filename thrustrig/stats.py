@@ -0,0 +1,241 @@
+import threading
+import collections
+import bisect
+import math
+import time
+
+import numpy as np
+
+from . import quality
+
+# Seconds of the rolling windows, the run window keeps every reading since the start or the last reset
+windows = [10, 60]
+percentiles = [5, 50, 95]
+# Seconds between two updates from the ring buffer
+period = 0.5
+# Readings kept for the exact run percentiles before the estimate takes over
+exact = 100
+fields = ['mean', 'min', 'max', 'std'] + [f'p{p}' for p in percentiles]
+
+class Moments:
+	# Welford running mean and variance, readings can be removed again in any order
+
+	def __init__(self):
+		self.n = 0
+		self.mean = 0.0
+		self.m2 = 0.0
+
+	def add(self, x):
+		self.n += 1
+		delta = x - self.mean
+		self.mean += delta / self.n
+		self.m2 += delta * (x - self.mean)
+
+	def remove(self, x):
+		self.n -= 1
+		if self.n == 0:
+			self.mean = 0.0
+			self.m2 = 0.0
+			return
+		delta = x - self.mean
+		self.mean -= delta / self.n
+		self.m2 = max(self.m2 - delta * (x - self.mean), 0.0)
+
+	def std(self):
+		return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+class P2:
+	# P-square estimate of a quantile (Jain and Chlamtac 1985): five markers, constant memory and time per reading.
+	# The markers start from the first readings, kept until there are enough of them
+
+	def __init__(self, p):
+		self.p = p
+		self.first = []
+		self.q = None
+		self.step = [0, p / 2, p, (1 + p) / 2, 1]
+
+	def start(self):
+		n = len(self.first) - 1
+		self.want = [n * f for f in self.step]
+		self.pos = [0, 0, 0, 0, n]
+		for i in range(1, 4):
+			self.pos[i] = min(max(round(self.want[i]), self.pos[i - 1] + 1), n - 4 + i)
+		self.q = [self.first[i] for i in self.pos]
+		self.first = None
+
+	def add(self, x):
+		if self.q is None:
+			bisect.insort(self.first, x)
+			if len(self.first) >= exact:
+				self.start()
+			return
+		q = self.q
+		if x < q[0]:
+			q[0] = x
+			k = 0
+		elif x >= q[4]:
+			q[4] = x
+			k = 3
+		else:
+			k = bisect.bisect_right(q, x) - 1
+		pos = self.pos
+		for i in range(k + 1, 5):
+			pos[i] += 1
+		for i in range(5):
+			self.want[i] += self.step[i]
+		for i in range(1, 4):
+			d = self.want[i] - pos[i]
+			if (d >= 1 and pos[i + 1] - pos[i] > 1) or (d <= -1 and pos[i - 1] - pos[i] < -1):
+				d = 1 if d > 0 else -1
+				# Parabolic prediction of the marker height, linear if it would leave the neighbours' range
+				h = q[i] + d / (pos[i + 1] - pos[i - 1]) * (
+					(pos[i] - pos[i - 1] + d) * (q[i + 1] - q[i]) / (pos[i + 1] - pos[i])
+					+ (pos[i + 1] - pos[i] - d) * (q[i] - q[i - 1]) / (pos[i] - pos[i - 1])
+				)
+				if not q[i - 1] < h < q[i + 1]:
+					h = q[i] + d * (q[i + d] - q[i]) / (pos[i + d] - pos[i])
+				q[i] = h
+				pos[i] += d
+
+	def value(self):
+		if self.q is None:
+			return quantile(self.first, self.p) if self.first else math.nan
+		return self.q[2]
+
+def quantile(ordered, p):
+	# Linear interpolation between the closest ranks, like np.percentile
+	x = p * (len(ordered) - 1)
+	i = int(x)
+	if i + 1 >= len(ordered):
+		return ordered[-1]
+	return ordered[i] + (x - i) * (ordered[i + 1] - ordered[i])
+
+class Window:
+	# Readings of one channel over the last span seconds. The extremes are the heads of monotonic deques and the
+	# percentiles are read from a sorted copy, found by bisection
+
+	def __init__(self, span):
+		self.span = span
+		self.values = collections.deque()
+		self.moments = Moments()
+		self.mins = collections.deque()
+		self.maxs = collections.deque()
+		self.ordered = []
+
+	def add(self, t, x):
+		self.values.append((t, x))
+		self.moments.add(x)
+		while self.mins and self.mins[-1] > x:
+			self.mins.pop()
+		self.mins.append(x)
+		while self.maxs and self.maxs[-1] < x:
+			self.maxs.pop()
+		self.maxs.append(x)
+		bisect.insort(self.ordered, x)
+
+	def expire(self, now):
+		while self.values and self.values[0][0] <= now - self.span:
+			_, x = self.values.popleft()
+			self.moments.remove(x)
+			if self.mins[0] == x:
+				self.mins.popleft()
+			if self.maxs[0] == x:
+				self.maxs.popleft()
+			del self.ordered[bisect.bisect_left(self.ordered, x)]
+
+	def result(self):
+		if not self.values:
+			return [math.nan] * len(fields)
+		m = self.moments
+		return [m.mean, self.mins[0], self.maxs[0], m.std()] + [quantile(self.ordered, p / 100) for p in percentiles]
+
+class RunWindow:
+	# Readings of one channel since the start of the run, in constant memory
+
+	def __init__(self):
+		self.moments = Moments()
+		self.min = math.inf
+		self.max = -math.inf
+		self.quantiles = [P2(p / 100) for p in percentiles]
+
+	def add(self, t, x):
+		self.moments.add(x)
+		self.min = min(self.min, x)
+		self.max = max(self.max, x)
+		for q in self.quantiles:
+			q.add(x)
+
+	def expire(self, now):
+		pass
+
+	def result(self):
+		m = self.moments
+		if m.n == 0:
+			return [math.nan] * len(fields)
+		return [m.mean, self.min, self.max, m.std()] + [q.value() for q in self.quantiles]
+
+class Stats:
+	# Rolling statistics of the columns of a rig, updated with the new rows only, and the rows flagged in the
+	# Quality column
+
+	def __init__(self, ncols, quality_col, nsensors):
+		self.ncols = ncols
+		self.quality_col = quality_col
+		self.nsensors = nsensors
+		self.lock = threading.Lock()
+		self.cleared = 0
+		self.clear()
+
+	def clear(self):
+		with self.lock:
+			# Per window, per column 1 to ncols - 1
+			self.windows = [[Window(span) for _ in range(1, self.ncols)] for span in windows]
+			self.windows.append([RunWindow() for _ in range(1, self.ncols)])
+			# Per sensor, rows with each flag of quality.flag_names
+			self.flagged = np.zeros((self.nsensors, len(quality.flag_names)), dtype=np.int64)
+			self.count = 0
+			self.cleared += 1
+
+	def state(self):
+		return self.cleared, self.count
+
+	def update(self, rows):
+		if len(rows) == 0:
+			return
+		with self.lock:
+			for row in rows.tolist():
+				t = row[0]
+				for col, x in enumerate(row[1:self.ncols]):
+					# Missing readings are left out
+					if x == x:
+						for window in self.windows:
+							window[col].add(t, x)
+			for window in self.windows:
+				for channel in window:
+					channel.expire(rows[-1, 0])
+			self.flagged += quality.counts(rows[:, self.quality_col], self.nsensors)
+			self.count += len(rows)
+
+	def read(self):
+		# Per window, per column, the values of fields
+		with self.lock:
+			return [[channel.result() for channel in window] for window in self.windows]
+
+	def read_quality(self):
+		# Rows since the start of the run and the flagged rows per sensor and flag
+		with self.lock:
+			return self.count, self.flagged.copy()
+
+	def run(self, buffer, stopped):
+		# Thread in the dashboard process, like the spectrum
+		seen = buffer.count()
+		while not stopped():
+			time.sleep(period)
+			count = buffer.count()
+			if count < seen:
+				# The rig was reset
+				self.clear()
+				seen = 0
+			first, rows = buffer.read(seen)
+			self.update(rows)
+			seen = first + len(rows)
@@ -0,0 +1,206 @@
+import time
+import json
+import math
+import threading
+import collections
+
+import numpy as np
+from flask import Response, abort
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+from . import compare
+from .utils import format_bytes, typed
+from .acquisition import sensor_names
+from . import quality
+
+# Seconds between two looks at the ring buffer of a rig
+poll_period = 0.05
+keepalive_period = 15
+# Messages kept for the clients that are behind
+backlog = 100
+
+def dumps(msg):
+	if orjson is not None:
+		return orjson.dumps(msg).decode()
+	return json.dumps(msg)
+
+def memory_text(rig):
+	mem = rig.memory()
+	return (
+		f"Live: {format_bytes(mem['live_used'])} of {format_bytes(mem['live_size'])} "
+		f"({mem['live_rows']} rows, {mem['live_history'] / 60:.0f} min kept) | "
+		f"Archive: {format_bytes(mem['archive'])} ({mem['archive_rows']} rows) | "
+		f"Run cache: {format_bytes(compare.cache.nbytes)} of {format_bytes(compare.cache.max_bytes)}"
+	)
+
+def spectrum_lines(spectrum, lines, reset):
+	offset = time.localtime().tm_gmtoff
+	return {
+		'reset': reset,
+		'f': typed([] if spectrum.freqs is None else spectrum.freqs),
+		't': typed([(line[0] + offset) * 1000 for line in lines]),
+		# The lines one after the other
+		'z': typed(np.concatenate([line[1] for line in lines]) if lines else [], 'f4'),
+		'peak': typed([line[2] for line in lines]),
+		'rot': typed([line[3] for line in lines]),
+	}
+
+def stats_values(results):
+	# JSON has no NaN, windows without readings have None
+	return [[[round(v, 3) if math.isfinite(v) else None for v in values] for values in window] for window in results]
+
+sensor_labels = {'temp': 'Coil temperature', 'batt': 'Battery', 'thrust': 'Thrust', 'rpm': 'RPM'}
+
+def quality_text(rows, flagged):
+	# Flagged rows of every sensor, None if there are none
+	parts = []
+	for name, counts in zip(sensor_names, flagged):
+		found = [f'{n} {label} ({100 * n / rows:.1f}%)' for n, label in zip(counts, quality.flag_names.values()) if n > 0]
+		if found:
+			parts.append(f"{sensor_labels[name]}: {', '.join(found)}")
+	if not parts:
+		return None
+	return 'Flagged rows - ' + '; '.join(parts)
+
+def device_text(lost):
+	if not lost:
+		return None
+	return 'No data from ' + ', '.join(sorted(lost)) + ', reconnecting'
+
+def trip_text(trip):
+	if trip is None:
+		return None
+	return f"Interlock tripped: {trip['reason']} (motor cut {trip['latency'] * 1000:.1f} ms after the sample)"
+
+def fresh_state():
+	# What a client was sent: rows, spectrum lines, statistics, PWM state, interlock and device texts
+	return {'sent': None, 'spec': None, 'stats': None, 'quality': False, 'pwm': None, 'trip': False, 'devices': False}
+
+def next_message(rig, state):
+	# Message with what changed since state, which is updated. A fresh state gives the whole picture
+	msg = {}
+	count = rig.buffer.count()
+	sent = state['sent']
+	if sent is None or count < sent:
+		# New client or the data was reset, send the whole live window
+		first, rows = rig.buffer.read()
+		msg['reset'] = True
+	elif count > sent:
+		first, rows = rig.buffer.read(sent)
+		# Fell behind by more than the ring holds
+		msg['reset'] = first > sent
+	if 'reset' in msg:
+		offset = time.localtime().tm_gmtoff
+		msg['t'] = typed((rows[:, 0] + offset) * 1000)
+		msg['y'] = [typed(rows[:, i]) for i in range(1, 7)]
+		msg['mem'] = memory_text(rig)
+		state['sent'] = first + len(rows)
+	spec = state['spec']
+	cleared, count = rig.spectrum.state()
+	if spec is None or cleared != spec[0] or count > spec[1]:
+		reset = spec is None or cleared != spec[0]
+		first, lines = rig.spectrum.read(0 if reset else spec[1])
+		msg['spec'] = spectrum_lines(rig.spectrum, lines, reset)
+		state['spec'] = (cleared, first + len(lines))
+	cur = rig.stats.state()
+	if cur != state['stats']:
+		msg['stats'] = stats_values(rig.stats.read())
+		state['stats'] = cur
+		cur = quality_text(*rig.stats.read_quality())
+		if cur != state['quality']:
+			msg['quality'] = state['quality'] = cur
+	pwmdriver = rig.pwmdriver
+	cur = (1000, False) if pwmdriver is None else (max(pwmdriver.val, 1000), pwmdriver.ramp_active)
+	if cur != state['pwm']:
+		msg['pwm'], msg['ramp'] = cur
+		state['pwm'] = cur
+	cur = trip_text(rig.trip_state())
+	if cur != state['trip']:
+		msg['trip'] = state['trip'] = cur
+	cur = device_text(rig.lost_devices())
+	if cur != state['devices']:
+		msg['devices'] = state['devices'] = cur
+	return msg
+
+class Broadcast:
+	# Builds the messages of a rig's stream once for all the browsers watching it, and only while one does.
+	# Clients copy the messages from a shared backlog; a new client, or one that fell behind the backlog, gets a
+	# snapshot of the whole picture, shared by the clients arriving in the same tick. Snapshot and backlog
+	# overlap, the browser drops what it already has by time
+
+	def __init__(self, rig):
+		self.rig = rig
+		self.cond = threading.Condition()
+		self.messages = collections.deque(maxlen=backlog)
+		self.seq = 0
+		self.clients = 0
+		self.running = False
+		# Sequence number, text and state of the last snapshot
+		self.snapshot = (None, None, None)
+
+	def get_snapshot(self):
+		# Called with the condition held
+		if self.snapshot[0] != self.seq:
+			state = fresh_state()
+			self.snapshot = (self.seq, f'data: {dumps(next_message(self.rig, state))}\n\n', state)
+		return self.snapshot[1]
+
+	def run(self, state):
+		# Goes on from the state of a snapshot, its clients miss nothing
+		while True:
+			time.sleep(poll_period)
+			with self.cond:
+				if self.clients == 0:
+					self.running = False
+					return
+			msg = next_message(self.rig, state)
+			if not msg:
+				continue
+			text = f'data: {dumps(msg)}\n\n'
+			with self.cond:
+				self.seq += 1
+				self.messages.append((self.seq, text))
+				self.cond.notify_all()
+
+	def events(self):
+		with self.cond:
+			self.clients += 1
+			seq = self.seq
+			text = self.get_snapshot()
+			if not self.running:
+				self.running = True
+				threading.Thread(target=self.run, args=(dict(self.snapshot[2]),), daemon=True).start()
+		try:
+			yield text
+			while True:
+				with self.cond:
+					self.cond.wait_for(lambda: self.seq > seq, timeout=keepalive_period)
+					if self.seq == seq:
+						# Lets the server notice clients that went away
+						text = ': keepalive\n\n'
+					elif self.seq - seq > len(self.messages):
+						text = self.get_snapshot()
+					else:
+						text = ''.join(m for s, m in self.messages if s > seq)
+					seq = self.seq
+				yield text
+		finally:
+			with self.cond:
+				self.clients -= 1
+
+def register_stream(server, rigs):
+	broadcasts = {name: Broadcast(rig) for name, rig in rigs.items()}
+
+	@server.route('/stream/<path:name>')
+	def stream(name):
+		if name not in rigs:
+			abort(404)
+		return Response(
+			broadcasts[name].events(),
+			mimetype='text/event-stream',
+			headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+		)
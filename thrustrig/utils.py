@@ -1,4 +1,10 @@
+import re
 import time
+import base64
+import threading
+import collections
+
+import numpy as np
 
 def time_it(name):
 	def deco(fn):
@@ -7,4 +13,55 @@ def time_it(name):
 			ret = fn(*args, **kwargs)
 			print(f"{name} took {time.time() - start} seconds")
 			return ret
-		return wrap
\ No newline at end of file
+		return wrap
+
+def safe_name(name):
+	return re.sub(r'[^\w.-]', '_', name)
+
+def local_time(ts):
+	# POSIX timestamps to naive local datetime64 values, like the datetimes in the CSV files
+	offset = time.localtime().tm_gmtoff
+	return ((np.asarray(ts, dtype=np.float64) + offset) * 1e6).astype('datetime64[us]')
+
+def typed(arr, dtype='f8'):
+	# Plotly's typed array form, the values are sent as base64 little-endian binary, NaN included
+	return {'dtype': dtype, 'bdata': base64.b64encode(np.ascontiguousarray(arr, dtype='<' + dtype).tobytes()).decode()}
+
+def format_bytes(n):
+	for unit in ['B', 'KB', 'MB']:
+		if n < 1024:
+			return f'{n:.1f} {unit}' if unit != 'B' else f'{n} B'
+		n /= 1024
+	return f'{n:.1f} GB'
+
+class SizedCache:
+	# LRU cache holding at most max_bytes, as measured by sizeof(value)
+
+	def __init__(self, max_bytes, sizeof):
+		self.max_bytes = max_bytes
+		self.sizeof = sizeof
+		self.entries = collections.OrderedDict()
+		self.nbytes = 0
+		self.lock = threading.Lock()
+
+	def get(self, key, compute):
+		with self.lock:
+			if key in self.entries:
+				self.entries.move_to_end(key)
+				return self.entries[key][0]
+		val = compute()
+		size = self.sizeof(val)
+		with self.lock:
+			if key not in self.entries:
+				self.entries[key] = (val, size)
+				self.nbytes += size
+			# Evict the least recently used entries, keep at least the new one
+			while self.nbytes > self.max_bytes and len(self.entries) > 1:
+				_, (_, old) = self.entries.popitem(last=False)
+				self.nbytes -= old
+		return val
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+			self.nbytes = 0